@@ -3,22 +3,41 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_jwt_extended import JWTManager
 from flask_cors import CORS
-from flask_mail import Mail, Message
+from flask_mail import Mail
+from app.rates import RateCache
+from app.catalog import CatalogCache
+from app.pricing import PriceMatrix
+from app.replica import RoutingSession
+from app.serialization import FastJSONProvider
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 migrate = Migrate()
 jwt = JWTManager()
 mail = Mail()
+rate_cache = RateCache()
+catalog_cache = CatalogCache()
+price_matrix = PriceMatrix()
 
-def create_app():
+def create_app(config_overrides=None):
     app = Flask(__name__)
+    app.json = FastJSONProvider(app)
     app.config.from_pyfile('../config.py')
+    if config_overrides:
+        app.config.update(config_overrides)
+
+    # Read replica for GET endpoints, same pool settings as the primary
+    replica_uri = app.config.get('SQLALCHEMY_REPLICA_URI')
+    if replica_uri:
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        binds['replica'] = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}), url=replica_uri)
+        app.config['SQLALCHEMY_BINDS'] = binds
 
     # ✅ This must be present and correctly configured
     CORS(app,
          supports_credentials=True,
          origins=["http://localhost:3000"],
-         allow_headers=["Content-Type", "Authorization"],
+         allow_headers=["Content-Type", "Authorization", "Idempotency-Key"],
+         expose_headers=["ETag", "X-Access-Token", "Idempotent-Replayed"],
          methods=["GET", "POST", "OPTIONS", "PATCH", "PUT"])
     
     
@@ -27,6 +46,18 @@ def create_app():
     migrate.init_app(app, db)
     jwt.init_app(app)
     mail.init_app(app)
+    rate_cache.init_app(app)
+    catalog_cache.init_app(app)
+    price_matrix.init_app(app)
+
+    from app import metrics
+    metrics.init_app(app)
+
+    from app import idempotency
+    idempotency.init_app(app)
+
+    from app import rate_history
+    rate_history.init_app(app)
 
     from app.routes import main
     app.register_blueprint(main)
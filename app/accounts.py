@@ -0,0 +1,70 @@
+from sqlalchemy import func, text
+from sqlalchemy.dialects.postgresql import insert
+
+from app import db
+from app.models import Account
+
+
+# Single-statement balance changes. The database applies them atomically,
+# so concurrent requests on the same account can't lose an update.
+
+def credit_account(user_id, currency, amount):
+    # Upsert on (user_id, currency): creates the account on first credit
+    stmt = insert(Account).values(user_id=user_id, currency=currency, balance=amount)
+    stmt = stmt.on_conflict_do_update(
+        constraint='uq_account_user_id_currency',
+        set_={'balance': func.coalesce(Account.balance, 0) + stmt.excluded.balance}
+    ).returning(Account.balance)
+    return db.session.execute(stmt).scalar_one()
+
+
+# Both accounts are locked in id order (the order settlement uses, so a
+# conversion can't deadlock with the opposite conversion or a settlement
+# chunk), then the conditional debit and the credit are applied, all in one
+# statement. A missing target account is created with the credit. Rows
+# inserted by a CTE aren't visible to its siblings, hence the separate
+# INSERT branch instead of creating the row first.
+CONVERT_SQL = text("""
+WITH locked AS (
+    SELECT id, currency, balance FROM account
+    WHERE user_id = :user_id AND currency IN (:from_currency, :to_currency)
+    ORDER BY id
+    FOR UPDATE
+), debited AS (
+    UPDATE account SET balance = account.balance - :amount
+    FROM locked
+    WHERE account.id = locked.id
+      AND locked.currency = :from_currency
+      AND locked.balance >= :amount
+    RETURNING account.balance
+), credited AS (
+    UPDATE account SET balance = COALESCE(account.balance, 0) + :converted
+    FROM locked
+    WHERE account.id = locked.id
+      AND locked.currency = :to_currency
+      AND EXISTS (SELECT 1 FROM debited)
+    RETURNING account.balance
+), created AS (
+    INSERT INTO account (user_id, currency, balance)
+    SELECT :user_id, :to_currency, :converted
+    WHERE EXISTS (SELECT 1 FROM debited)
+      AND NOT EXISTS (SELECT 1 FROM locked WHERE currency = :to_currency)
+    ON CONFLICT ON CONSTRAINT uq_account_user_id_currency
+    DO UPDATE SET balance = COALESCE(account.balance, 0) + EXCLUDED.balance
+    RETURNING balance
+)
+SELECT (SELECT balance FROM debited) AS from_balance,
+       COALESCE((SELECT balance FROM credited), (SELECT balance FROM created)) AS to_balance
+""")
+
+
+def convert_balance(user_id, from_currency, to_currency, amount, converted):
+    # Returns (new source balance, new target balance), or None when the
+    # source account is missing or short of funds (nothing is changed then)
+    row = db.session.execute(CONVERT_SQL, {
+        'user_id': user_id, 'from_currency': from_currency, 'to_currency': to_currency,
+        'amount': amount, 'converted': converted
+    }).one()
+    if row.from_balance is None:
+        return None
+    return row.from_balance, row.to_balance
@@ -0,0 +1,82 @@
+from functools import wraps
+
+from flask import g, jsonify
+from flask_jwt_extended import create_access_token, create_refresh_token, get_jwt, get_jwt_identity, verify_jwt_in_request
+
+from app.models import User
+
+
+class AccessDenied(Exception):
+    pass
+
+
+def issue_token(user):
+    # Everything routes need to authorize a caller travels in the token
+    return create_access_token(identity=str(user.id), additional_claims={
+        'id': user.id,
+        'email': user.email,
+        'is_admin': bool(user.is_admin),
+        'is_verified': bool(user.is_verified)
+    })
+
+
+def issue_refresh_token(user):
+    # Only good for /token/refresh, carries no authorization claims
+    return create_refresh_token(identity=str(user.id))
+
+
+def caller_id():
+    return int(get_jwt_identity())
+
+
+def caller_is_admin():
+    return bool(get_jwt().get('is_admin'))
+
+
+def resolve_user_id(requested=None):
+    # The caller acts on their own data, admins may act on anyone's
+    caller = caller_id()
+    if requested is None or requested == '':
+        return caller
+    try:
+        requested = int(requested)
+    except (TypeError, ValueError):
+        raise AccessDenied('Invalid user id')
+    if requested != caller and not caller_is_admin():
+        raise AccessDenied('Not allowed to act for another user')
+    return requested
+
+
+def user_is_verified(user_id):
+    """Check verification from the token claim when possible.
+
+    Only a token that still says "unverified" (or a request made for
+    another user) costs a lookup. If the user has been verified since the
+    token was issued, a fresh token is attached to the response.
+    """
+    if user_id == caller_id() and get_jwt().get('is_verified'):
+        return True
+
+    user = User.query.get(user_id)
+    if not user or not user.is_verified:
+        return False
+    if user_id == caller_id():
+        g.refreshed_token = issue_token(user)
+    return True
+
+
+def attach_refreshed_token(response):
+    token = g.pop('refreshed_token', None)
+    if token:
+        response.headers['X-Access-Token'] = token
+    return response
+
+
+def admin_required(fn):
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        verify_jwt_in_request()
+        if not caller_is_admin():
+            return jsonify({'error': 'Admin access required'}), 403
+        return fn(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,57 @@
+import hashlib
+import threading
+import time
+from collections import namedtuple
+
+CatalogSnapshot = namedtuple('CatalogSnapshot', ['version', 'body', 'etag', 'built_at'])
+
+
+class CatalogCache:
+    """In-process snapshot of the rendered /products payload.
+
+    Every write path that changes the catalog calls ``invalidate()``, which
+    bumps ``version`` and drops the snapshot. The next read rebuilds it
+    once. ``max_age`` bounds how long a snapshot may live, which covers
+    writes made by other processes (e.g. settlement workers).
+
+    Variants of the payload (e.g. prices in another currency) are kept
+    side by side under their own ``key`` and invalidated together.
+    """
+
+    def __init__(self, max_age=30):
+        self.max_age = max_age
+        self.version = 0
+        self._snapshots = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        app.config.setdefault('CATALOG_SNAPSHOT_MAX_AGE', self.max_age)
+        self.max_age = app.config['CATALOG_SNAPSHOT_MAX_AGE']
+        app.extensions['catalog_cache'] = self
+
+    def invalidate(self):
+        with self._lock:
+            self.version += 1
+            self._snapshots.clear()
+
+    def snapshot(self, render, key=None):
+        with self._lock:
+            snapshot = self._snapshots.get(key)
+            if snapshot is not None and time.monotonic() - snapshot.built_at < self.max_age:
+                return snapshot
+            version = self.version
+
+        body = render()
+        # Hash of the payload rather than the local version number, so every
+        # process serving the same catalog hands out the same ETag
+        etag = hashlib.sha1(body).hexdigest()
+        snapshot = CatalogSnapshot(version, body, etag, time.monotonic())
+
+        with self._lock:
+            # A write landed while rendering, don't cache what may already be stale
+            if self.version == version:
+                # Drop variants that aged out so old keys don't pile up
+                now = time.monotonic()
+                self._snapshots = {k: s for k, s in self._snapshots.items() if now - s.built_at < self.max_age}
+                self._snapshots[key] = snapshot
+        return snapshot
@@ -0,0 +1,218 @@
+"""Idempotency-Key support for money-moving endpoints.
+
+A client that retries with the same ``Idempotency-Key`` header gets the
+stored response of the first attempt instead of a second debit, credit
+or purchase. Keys are scoped to the caller and expire after
+``IDEMPOTENCY_KEY_TTL`` seconds.
+
+The key row is inserted in the same transaction as the request's own
+writes, and views commit through ``commit_with_response`` so the stored
+response is part of that same transaction: a key is either absent or
+complete. A concurrent duplicate waits on the row and then replays, or
+gets 409 while the first request is running. Only 2xx responses are
+stored; failed attempts leave no row behind and may be retried.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from functools import wraps
+
+from flask import current_app, g, jsonify, make_response, request
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects.postgresql import insert
+
+from app import db
+from app.auth import caller_id
+from app.models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+REPLAY_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+
+
+class ResponseCache:
+    """Small LRU of completed responses in front of the idempotency_key table."""
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id, key):
+        with self._lock:
+            entry = self._entries.get((user_id, key))
+            if entry is None:
+                return None
+            if entry[3] <= datetime.utcnow():
+                del self._entries[(user_id, key)]
+                return None
+            self._entries.move_to_end((user_id, key))
+            return entry
+
+    def put(self, user_id, key, fingerprint, status_code, body, expires_at):
+        with self._lock:
+            self._entries[(user_id, key)] = (fingerprint, status_code, body, expires_at)
+            self._entries.move_to_end((user_id, key))
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_cache = ResponseCache()
+
+
+def init_app(app):
+    app.config.setdefault('IDEMPOTENCY_KEY_TTL', 86400)
+    app.config.setdefault('IDEMPOTENCY_CACHE_SIZE', 10000)
+    _cache.max_size = app.config['IDEMPOTENCY_CACHE_SIZE']
+    app.extensions['idempotency_cache'] = _cache
+
+
+def request_fingerprint():
+    # Same endpoint and same JSON body, key order and whitespace don't matter
+    payload = request.get_json(silent=True)
+    if payload is None:
+        body = request.get_data()
+    else:
+        body = json.dumps(payload, sort_keys=True, separators=(',', ':')).encode()
+    return hashlib.sha256(request.path.encode() + b'\n' + body).hexdigest()
+
+
+def _mismatch():
+    return jsonify({'error': f'{HEADER} was already used for a different request'}), 422
+
+
+def _replay(fingerprint, stored_fingerprint, status_code, body):
+    if fingerprint != stored_fingerprint:
+        return _mismatch()
+    response = current_app.response_class(body, status=status_code, mimetype='application/json')
+    response.headers[REPLAY_HEADER] = 'true'
+    return response
+
+
+def _claim(user_id, key, fingerprint, now, expires_at):
+    # Inserts the in-progress row, or takes over one that has expired.
+    # Returns False when a live row already exists.
+    stmt = insert(IdempotencyKey).values(
+        user_id=user_id, key=key, fingerprint=fingerprint,
+        created_at=now, expires_at=expires_at
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['user_id', 'key'],
+        set_={'fingerprint': fingerprint, 'status_code': None, 'response_body': None,
+              'created_at': now, 'expires_at': expires_at},
+        where=IdempotencyKey.expires_at <= now
+    ).returning(IdempotencyKey.key)
+    return db.session.execute(stmt).first() is not None
+
+
+def commit_with_response(payload, status=200):
+    """Commit the view's transaction and return ``payload`` as its JSON response.
+
+    Under an Idempotency-Key the response is written into the key row
+    before the commit, so it can't be lost once the writes are visible.
+    """
+    response = current_app.json.response(payload)
+    response.status_code = status
+    claim = g.pop('idempotency_claim', None)
+    if claim is not None and 200 <= status < 300:
+        user_id, key = claim
+        db.session.execute(
+            update(IdempotencyKey)
+            .where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+            .values(status_code=status, response_body=response.get_data(as_text=True))
+            .execution_options(synchronize_session=False)
+        )
+    db.session.commit()
+    return response
+
+
+def idempotent(fn):
+    """Honour an ``Idempotency-Key`` header. Apply below ``jwt_required``."""
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return fn(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return jsonify({'error': f'{HEADER} is too long'}), 400
+
+        user_id = caller_id()
+        fingerprint = request_fingerprint()
+
+        cached = _cache.get(user_id, key)
+        if cached is not None:
+            return _replay(fingerprint, *cached[:3])
+
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=current_app.config.get('IDEMPOTENCY_KEY_TTL', 86400))
+        if not _claim(user_id, key, fingerprint, now, expires_at):
+            stored = db.session.execute(
+                select(IdempotencyKey.fingerprint, IdempotencyKey.status_code,
+                       IdempotencyKey.response_body, IdempotencyKey.expires_at)
+                .where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+            ).first()
+            db.session.rollback()
+            if stored is None:
+                # Purged between the insert and the select, ask the client to retry
+                return jsonify({'error': 'Request with this key is in progress'}), 409
+            if stored.status_code is None:
+                if stored.fingerprint != fingerprint:
+                    return _mismatch()
+                return jsonify({'error': 'Request with this key is in progress'}), 409
+            _cache.put(user_id, key, *stored)
+            return _replay(fingerprint, stored.fingerprint, stored.status_code, stored.response_body)
+
+        # The view commits the key row and its response together with its own writes
+        g.idempotency_claim = (user_id, key)
+        try:
+            response = make_response(fn(*args, **kwargs))
+        except Exception:
+            db.session.rollback()
+            raise
+        finally:
+            stored = 'idempotency_claim' not in g
+            g.pop('idempotency_claim', None)
+
+        if not 200 <= response.status_code < 300:
+            db.session.rollback()
+            # A view that committed before failing must not leave the key stuck in
+            # progress. created_at identifies this attempt's row, not a retry's.
+            db.session.execute(
+                delete(IdempotencyKey)
+                .where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key,
+                       IdempotencyKey.created_at == now, IdempotencyKey.status_code.is_(None))
+            )
+            db.session.commit()
+            return response
+
+        body = response.get_data(as_text=True)
+        if not stored:
+            # View committed on its own, store the response late rather than not at all
+            print(f"{fn.__name__} should commit with commit_with_response()")
+            db.session.execute(
+                update(IdempotencyKey)
+                .where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+                .values(status_code=response.status_code, response_body=body)
+                .execution_options(synchronize_session=False)
+            )
+            db.session.commit()
+        _cache.put(user_id, key, fingerprint, response.status_code, body, expires_at)
+        return response
+    return wrapper
+
+
+def purge_expired_keys(app):
+    with app.app_context():
+        result = db.session.execute(
+            delete(IdempotencyKey).where(IdempotencyKey.expires_at < datetime.utcnow())
+        )
+        db.session.commit()
+        if result.rowcount:
+            print(f"Purged {result.rowcount} expired idempotency keys")
+        return result.rowcount
@@ -0,0 +1,37 @@
+from apscheduler.schedulers.background import BackgroundScheduler
+
+from app.leader import elect_leader
+from app.idempotency import purge_expired_keys
+from app.outbox import send_outbox
+from app.rate_history import prefetch_rates
+from app.settlement import Settler, expire_reservations
+
+
+def start_background_jobs(app, should_run=None):
+    # Settlement runs here unless standalone workers (worker.py) own it
+    if app.config.get('SETTLEMENT_IN_WEB_PROCESS', True):
+        Settler(app, listen=True, should_run=should_run).start()
+
+    def gated(job):
+        def run():
+            if should_run is None or should_run():
+                job(app)
+        return run
+
+    scheduler = BackgroundScheduler()
+    scheduler.add_job(func=gated(send_outbox), trigger="interval",
+                      seconds=app.config.get('OUTBOX_POLL_SECONDS', 10))
+    scheduler.add_job(func=gated(expire_reservations), trigger="interval",
+                      seconds=app.config.get('SETTLEMENT_SWEEP_SECONDS', 60))
+    # Persisted ahead of EXCHANGE_RATE_TTL so processes find a fresh snapshot instead of calling upstream
+    scheduler.add_job(func=gated(prefetch_rates), trigger="interval",
+                      seconds=app.config.get('EXCHANGE_RATE_PREFETCH_SECONDS', 240))
+    scheduler.add_job(func=gated(purge_expired_keys), trigger="interval",
+                      seconds=app.config.get('IDEMPOTENCY_PURGE_SECONDS', 3600))
+    scheduler.start()
+    return scheduler
+
+
+def start_background_jobs_as_leader(app):
+    # However many web workers or nodes run, only the advisory lock holder runs the jobs
+    return elect_leader(app, lambda lock: start_background_jobs(app, should_run=lock.is_held))
@@ -0,0 +1,83 @@
+import threading
+import time
+
+from sqlalchemy import text
+
+from app import db
+
+
+class LeaderLock:
+    """Session-level Postgres advisory lock held on a dedicated connection.
+
+    Whichever process holds the lock is the leader. If that process dies
+    its connection closes, Postgres drops the lock, and the next
+    ``try_acquire()`` elsewhere wins it.
+    """
+
+    def __init__(self, app, key):
+        self.app = app
+        self.key = key
+        self.held = False
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def is_held(self):
+        return self.held
+
+    def try_acquire(self):
+        with self._lock:
+            try:
+                if self._connection is None:
+                    with self.app.app_context():
+                        self._connection = db.engine.connect().execution_options(isolation_level='AUTOCOMMIT')
+                if self.held:
+                    # Heartbeat: the lock lives exactly as long as this connection
+                    self._connection.execute(text('SELECT 1'))
+                else:
+                    self.held = bool(self._connection.execute(
+                        text('SELECT pg_try_advisory_lock(:key)'), {'key': self.key}).scalar())
+            except Exception as e:
+                print(f"Leader lock connection lost: {e}")
+                self._drop_connection()
+            return self.held
+
+    def release(self):
+        with self._lock:
+            if self._connection is not None and self.held:
+                try:
+                    self._connection.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': self.key})
+                except Exception:
+                    pass
+            self._drop_connection()
+
+    def _drop_connection(self):
+        self.held = False
+        if self._connection is not None:
+            try:
+                self._connection.invalidate()
+            except Exception:
+                pass
+            self._connection = None
+
+
+def elect_leader(app, on_elected):
+    """Keep competing for leadership in a background thread.
+
+    ``on_elected(lock)`` runs once, the first time this process wins.
+    Jobs it starts should check ``lock.is_held()`` before each run, so
+    they pause if leadership is lost and resume if it is won back.
+    """
+    lock = LeaderLock(app, app.config.get('SCHEDULER_LOCK_KEY', 7262521))
+    interval = app.config.get('LEADER_RETRY_SECONDS', 10)
+
+    def loop():
+        started = False
+        while True:
+            if lock.try_acquire() and not started:
+                print("Elected scheduler leader")
+                on_elected(lock)
+                started = True
+            time.sleep(interval)
+
+    threading.Thread(target=loop, name='leader-election', daemon=True).start()
+    return lock
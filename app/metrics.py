@@ -0,0 +1,245 @@
+"""Minimal in-process metrics exposed in the Prometheus text format.
+
+Metrics are per process; with several workers, scrape each one (or
+aggregate on the Prometheus side).
+"""
+import math
+import threading
+import time
+
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250, 500, 1000)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(n, '') for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        key = tuple(labels.get(n, '') for n in self.labelnames)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield self.name, _format_labels(self.labelnames, key), value
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(n, '') for n in self.labelnames)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        for key, counts, total in items:
+            for bound, count in zip(self.buckets, counts):
+                le = f'le="{_format_value(bound)}"'
+                yield f'{self.name}_bucket', _format_labels(self.labelnames, key, le), count
+            yield f'{self.name}_sum', _format_labels(self.labelnames, key), total
+            yield f'{self.name}_count', _format_labels(self.labelnames, key), counts[-1]
+
+
+class Gauge:
+    # Value is read from a callback at scrape time: {label tuple: value} or a number
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+
+    def samples(self):
+        if self.callback is None:
+            return
+        values = self.callback()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for key, value in values.items():
+            yield self.name, _format_labels(self.labelnames, key), value
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and 'outcome' in self.histogram.labelnames:
+            self.labels = dict(self.labels, outcome='error')
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, labelnames=(), callback=None):
+        return self.register(Gauge(name, documentation, labelnames, callback))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{labels} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+REQUEST_LATENCY = registry.histogram(
+    'http_request_duration_seconds', 'Request latency by endpoint.',
+    ['endpoint', 'method', 'status'])
+REQUEST_SQL_STATEMENTS = registry.histogram(
+    'http_request_sql_statements', 'SQL statements executed per request.',
+    ['endpoint'], buckets=COUNT_BUCKETS)
+REQUEST_SQL_SECONDS = registry.histogram(
+    'http_request_sql_seconds', 'Time spent in SQL per request.', ['endpoint'])
+SQL_STATEMENTS = registry.counter(
+    'sql_statements_total', 'SQL statements executed, including background jobs.')
+EXCHANGE_RATE_FETCH_SECONDS = registry.histogram(
+    'exchange_rate_fetch_seconds', 'Upstream exchange rate call latency.', ['outcome'])
+SMTP_SEND_SECONDS = registry.histogram(
+    'smtp_send_seconds', 'Time to send one message over SMTP.', ['outcome'])
+SETTLEMENT_BATCH_SIZE = registry.histogram(
+    'settlement_batch_size', 'Purchases settled per settlement chunk.', buckets=COUNT_BUCKETS)
+SETTLEMENT_BATCH_SECONDS = registry.histogram(
+    'settlement_batch_duration_seconds', 'Time to settle one chunk, claim to commit.')
+
+_engine_hooks_installed = False
+
+
+def init_app(app):
+    global _engine_hooks_installed
+
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
+
+    # Listening on the Engine class covers the primary and any bind
+    if not _engine_hooks_installed:
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        _engine_hooks_installed = True
+
+    rate_cache = app.extensions.get('rate_cache')
+    if rate_cache is not None:
+        registry.gauge(
+            'exchange_rate_cache_requests', 'Rate cache lookups by result.', ['result'],
+            callback=lambda: {(k,): v for k, v in rate_cache.stats().items()
+                              if k in ('hits', 'misses', 'stale_hits', 'errors')})
+        registry.gauge(
+            'exchange_rate_cache_hit_ratio', 'Share of rate lookups served from memory.',
+            callback=lambda: _hit_ratio(rate_cache.stats()))
+
+
+def metrics_view():
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+
+def _hit_ratio(stats):
+    served = stats['hits'] + stats['stale_hits']
+    total = served + stats['misses']
+    return served / total if total else 0.0
+
+
+def _start_request():
+    g.metrics_start = time.perf_counter()
+    g.sql_statements = 0
+    g.sql_seconds = 0.0
+
+
+def _finish_request(response):
+    start = g.pop('metrics_start', None)
+    if start is None:
+        return response
+    endpoint = request.endpoint or 'unknown'
+    REQUEST_LATENCY.observe(time.perf_counter() - start,
+                            endpoint=endpoint, method=request.method, status=response.status_code)
+    REQUEST_SQL_STATEMENTS.observe(g.get('sql_statements', 0), endpoint=endpoint)
+    REQUEST_SQL_SECONDS.observe(g.get('sql_seconds', 0.0), endpoint=endpoint)
+    return response
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('metrics_query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('metrics_query_start')
+    elapsed = time.perf_counter() - starts.pop() if starts else 0.0
+    SQL_STATEMENTS.inc()
+    if has_request_context() and 'sql_statements' in g:
+        g.sql_statements += 1
+        g.sql_seconds += elapsed
@@ -7,7 +7,17 @@ class PurchaseStatus(Enum):
     COMPLETED = 'completed'
     FAILED = 'failed'
 
+class OutboxStatus(Enum):
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+
 class User(db.Model):
+    __table_args__ = (
+        db.Index('ix_user_is_admin', 'id', postgresql_where=db.text('is_admin = true')),
+        db.Index('ix_user_unverified', 'id', postgresql_where=db.text('is_verified = false')),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(120), nullable=False)
     surname = db.Column(db.String(120), nullable=False)
@@ -28,6 +38,10 @@ class Product(db.Model):
     currency = db.Column(db.String(120), nullable=False)
 
 class Card(db.Model):
+    __table_args__ = (
+        db.Index('ix_card_user_id', 'user_id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     number = db.Column(db.String(20), nullable=False)
     expiry = db.Column(db.String(10), nullable=False)
@@ -35,12 +49,25 @@ class Card(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
 
 class Account(db.Model):
+    # Also serves every filter_by(user_id=..., currency=...) lookup
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'currency', name='uq_account_user_id_currency'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     currency = db.Column(db.String(10), nullable=False)
     balance = db.Column(db.Float, default=0.0)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
 
 class Purchase(db.Model):
+    __table_args__ = (
+        db.Index('ix_purchase_status', 'status'),
+        db.Index('ix_purchase_user_id_created_at', 'user_id', 'created_at'),
+        db.Index('ix_purchase_created_at_id', 'created_at', 'id'),
+        # Settlement only ever scans pending rows, keep that index tiny
+        db.Index('ix_purchase_pending', 'id', postgresql_where=db.text("status = 'pending'")),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
@@ -49,3 +76,61 @@ class Purchase(db.Model):
     status = db.Column(db.String(20), default=PurchaseStatus.PENDING.value)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     processed_at = db.Column(db.DateTime, nullable=True)
+    claimed_by = db.Column(db.String(64), nullable=True)
+    claimed_until = db.Column(db.DateTime, nullable=True)
+    # Stock was taken when the purchase was created, settlement must not take it again
+    stock_reserved = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
+
+class EmailOutbox(db.Model):
+    __tablename__ = 'email_outbox'
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(32), nullable=False, default='message')
+    subject = db.Column(db.String(255), nullable=False)
+    sender = db.Column(db.String(256), nullable=True)
+    recipients = db.Column(db.Text, nullable=False)  # comma separated
+    body = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default=OutboxStatus.PENDING.value)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+class SalesDaily(db.Model):
+    # Rollup of completed purchases, maintained by settlement
+    __tablename__ = 'sales_daily'
+
+    day = db.Column(db.Date, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), primary_key=True)
+    currency = db.Column(db.String(10), primary_key=True)
+    sales_count = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+
+class IdempotencyKey(db.Model):
+    # Outcome of a money-moving request, replayed when the client retries with the same key
+    __tablename__ = 'idempotency_key'
+    __table_args__ = (
+        db.Index('ix_idempotency_key_expires_at', 'expires_at'),
+    )
+
+    user_id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(255), primary_key=True)
+    fingerprint = db.Column(db.String(64), nullable=False)
+    status_code = db.Column(db.Integer, nullable=True)  # NULL while the first request is running
+    response_body = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+class ExchangeRate(db.Model):
+    # Persisted rate snapshots: all rows of one (base, fetched_at) form one table
+    __tablename__ = 'exchange_rate'
+    __table_args__ = (
+        db.Index('ix_exchange_rate_base_fetched_at', 'base', 'fetched_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    base = db.Column(db.String(10), nullable=False)
+    currency = db.Column(db.String(10), nullable=False)
+    rate = db.Column(db.Float, nullable=False)
+    fetched_at = db.Column(db.DateTime, nullable=False)
@@ -0,0 +1,108 @@
+from datetime import datetime, timedelta
+
+from flask_mail import Message
+
+from app import db, mail
+from app.metrics import SMTP_SEND_SECONDS
+from app.models import EmailOutbox, OutboxStatus
+
+
+def enqueue_email(subject, recipients, body, sender=None, kind='message'):
+    # Only adds to the session, the row commits together with the caller's transaction
+    outbox = EmailOutbox(
+        kind=kind,
+        subject=subject,
+        sender=sender,
+        recipients=','.join(recipients),
+        body=body,
+        status=OutboxStatus.PENDING.value,
+        attempts=0,
+        next_attempt_at=datetime.utcnow()
+    )
+    db.session.add(outbox)
+    return outbox
+
+
+def send_outbox(app, batch_size=None):
+    """Deliver due outbox rows over a single SMTP connection.
+
+    Purchase reports waiting for the same recipients are combined into one
+    digest message. Failed sends are retried with exponential backoff until
+    ``OUTBOX_MAX_ATTEMPTS`` is reached. Returns the number of rows sent.
+    """
+    with app.app_context():
+        batch_size = batch_size or app.config.get('OUTBOX_BATCH_SIZE', 100)
+        rows = EmailOutbox.query\
+            .filter_by(status=OutboxStatus.PENDING.value)\
+            .filter(EmailOutbox.next_attempt_at <= datetime.utcnow())\
+            .order_by(EmailOutbox.id)\
+            .limit(batch_size)\
+            .with_for_update(skip_locked=True)\
+            .all()
+        if not rows:
+            db.session.rollback()
+            return 0
+
+        messages = _build_messages(rows)
+        sent = 0
+        remaining = list(messages)
+        try:
+            with mail.connect() as connection:
+                while remaining:
+                    msg, group = remaining.pop(0)
+                    try:
+                        with SMTP_SEND_SECONDS.time(outcome='ok'):
+                            connection.send(msg)
+                    except Exception as e:
+                        _schedule_retry(app, group, e)
+                        continue
+                    now = datetime.utcnow()
+                    for row in group:
+                        row.status = OutboxStatus.SENT.value
+                        row.sent_at = now
+                        row.attempts += 1
+                    sent += len(group)
+        except Exception as e:
+            # Connecting (or the connection itself) failed, retry whatever wasn't sent
+            print(f"SMTP connection failed: {e}")
+            for _, group in remaining:
+                _schedule_retry(app, group, e)
+
+        db.session.commit()
+        return sent
+
+
+def _build_messages(rows):
+    messages = []
+    digests = {}
+    for row in rows:
+        if row.kind == 'purchase_report':
+            digests.setdefault((row.sender, row.recipients, row.subject), []).append(row)
+            continue
+        messages.append((_message(row.subject, row.sender, row.recipients, row.body), [row]))
+
+    for (sender, recipients, subject), group in digests.items():
+        body = '\n'.join(row.body for row in group)
+        messages.append((_message(subject, sender, recipients, body), group))
+    return messages
+
+
+def _message(subject, sender, recipients, body):
+    return Message(subject=subject,
+                   sender=sender,
+                   recipients=recipients.split(','),
+                   body=body)
+
+
+def _schedule_retry(app, group, error):
+    base = app.config.get('OUTBOX_RETRY_BASE_SECONDS', 30)
+    cap = app.config.get('OUTBOX_RETRY_MAX_SECONDS', 3600)
+    max_attempts = app.config.get('OUTBOX_MAX_ATTEMPTS', 8)
+    now = datetime.utcnow()
+    for row in group:
+        row.attempts += 1
+        row.last_error = str(error)
+        if row.attempts >= max_attempts:
+            row.status = OutboxStatus.FAILED.value
+        else:
+            row.next_attempt_at = now + timedelta(seconds=min(cap, base * 2 ** (row.attempts - 1)))
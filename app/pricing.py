@@ -0,0 +1,111 @@
+import itertools
+import math
+import threading
+import time
+
+try:
+    import numpy
+except ImportError:  # optional, the matrix is built in pure Python without it
+    numpy = None
+
+
+class PriceTable:
+    """One build of the price matrix: every product priced in every currency of ``rates``.
+
+    Values are ``price * (rates[to] / rates[from])`` unrounded, exactly the
+    product a live conversion computes, and rounded to 2 decimals on read.
+    Products whose currency has no rate get no prices.
+    """
+
+    def __init__(self, version, rates, products):
+        self.version = version
+        self.rates = rates
+        self.built_at = time.monotonic()
+        self.currencies = sorted(code for code, rate in rates.items() if rate)
+        self.currency_index = {code: j for j, code in enumerate(self.currencies)}
+        self.product_index = {row.id: i for i, row in enumerate(products)}
+        self.base_prices = [row.price for row in products]
+        self.base_currencies = [row.currency for row in products]
+        self.values = self._compute()
+
+    def _compute(self):
+        to_rates = [self.rates[code] for code in self.currencies]
+        from_rates = [self.rates.get((code or '').upper()) or math.nan for code in self.base_currencies]
+        prices = [math.nan if price is None else price for price in self.base_prices]
+        if numpy is not None:
+            # One pass over the whole products x currencies grid
+            factors = numpy.array(to_rates)[None, :] / numpy.array(from_rates)[:, None]
+            return numpy.array(prices)[:, None] * factors
+        return [[price * (to_rate / from_rate) for to_rate in to_rates]
+                for price, from_rate in zip(prices, from_rates)]
+
+    def convert(self, amount, from_currency, to_currency):
+        # Same arithmetic with this build's rates, for products newer than the build
+        from_rate = self.rates.get((from_currency or '').upper())
+        to_rate = self.rates.get(to_currency.upper())
+        if not from_rate or to_rate is None or amount is None:
+            return None
+        return round(amount * (to_rate / from_rate), 2)
+
+    def price(self, product_id, currency, base_price=None, base_currency=None):
+        """Price of a product in ``currency``, or None when it isn't in this build.
+
+        Passing the product's current ``base_price``/``base_currency``
+        rejects entries built from an older price.
+        """
+        i = self.product_index.get(product_id)
+        j = self.currency_index.get(currency.upper())
+        if i is None or j is None:
+            return None
+        if base_price is not None and (self.base_prices[i] != base_price
+                                       or self.base_currencies[i] != base_currency):
+            return None
+        value = float(self.values[i][j])
+        if math.isnan(value):
+            return None
+        return round(value, 2)
+
+
+class PriceMatrix:
+    """Process-wide price matrix, rebuilt when the rate table or the products change.
+
+    The rate cache hands out a new table object on every refresh, so a
+    build is reused for as long as it was made from the same table.
+    ``invalidate()`` is called when products are added or repriced, and
+    ``max_age`` covers changes made by other processes.
+    """
+
+    def __init__(self, max_age=30):
+        self.max_age = max_age
+        self.version = 0
+        self._table = None
+        self._builds = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.max_age = app.config.get('CATALOG_SNAPSHOT_MAX_AGE', self.max_age)
+        app.extensions['price_matrix'] = self
+
+    def invalidate(self):
+        with self._lock:
+            self.version += 1
+            self._table = None
+
+    def current(self, rates, load_products):
+        # load_products() returns rows with id, price and currency
+        if not rates:
+            return None
+        with self._lock:
+            table = self._table
+            if (table is not None and table.rates is rates
+                    and time.monotonic() - table.built_at < self.max_age):
+                return table
+            version = self.version
+
+        table = PriceTable(next(self._builds), rates, load_products())
+
+        with self._lock:
+            # A product changed while building, use this build once but don't keep it
+            if self.version == version:
+                self._table = table
+        return table
@@ -0,0 +1,34 @@
+from datetime import datetime, timedelta
+
+from flask import current_app
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+
+
+class InvalidQuote(ValueError):
+    pass
+
+
+def _serializer():
+    secret = current_app.config.get('SECRET_KEY') or current_app.config['JWT_SECRET_KEY']
+    return URLSafeTimedSerializer(secret, salt='rate-quote')
+
+
+def issue_quote(kind, **fields):
+    # Signed, not encrypted: the client can read the rate but can't change it
+    ttl = current_app.config.get('QUOTE_TTL_SECONDS', 60)
+    token = _serializer().dumps(dict(fields, kind=kind))
+    expires_at = datetime.utcnow() + timedelta(seconds=ttl)
+    return token, expires_at.isoformat()
+
+
+def load_quote(token, kind):
+    ttl = current_app.config.get('QUOTE_TTL_SECONDS', 60)
+    try:
+        quote = _serializer().loads(token, max_age=ttl)
+    except SignatureExpired:
+        raise InvalidQuote('Quote expired')
+    except BadSignature:
+        raise InvalidQuote('Invalid quote')
+    if not isinstance(quote, dict) or quote.get('kind') != kind:
+        raise InvalidQuote('Invalid quote')
+    return quote
@@ -0,0 +1,92 @@
+"""Exchange rate snapshots persisted in the exchange_rate table.
+
+The leader's prefetch job fetches the whole table against
+EXCHANGE_RATE_BASE in one upstream call every
+EXCHANGE_RATE_PREFETCH_SECONDS and stores it. Every process's RateCache
+reads the latest snapshot through ``DatabaseRateStore`` on cold start and
+when upstream fails, and ``rate_at`` answers which rate was in effect at
+a given moment.
+"""
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import func, insert, select
+
+from app import db
+from app.models import ExchangeRate
+
+
+class DatabaseRateStore:
+    # Always the full table: other processes load a snapshot as their whole cache fill
+    def __init__(self, app):
+        self.app = app
+
+    def latest(self, base, at=None):
+        # (table, fetched_at) of the newest snapshot, taken at or before ``at`` if given
+        with self.app.app_context():
+            return _snapshot(base, at)
+
+    def save(self, base, table, fetched_at):
+        rows = [
+            {'base': base, 'currency': currency, 'rate': rate, 'fetched_at': fetched_at}
+            for currency, rate in table.items()
+        ]
+        with self.app.app_context():
+            db.session.execute(insert(ExchangeRate), rows)
+            db.session.commit()
+
+
+def _snapshot(base, at=None):
+    newest = select(func.max(ExchangeRate.fetched_at)).where(ExchangeRate.base == base)
+    if at is not None:
+        newest = newest.where(ExchangeRate.fetched_at <= at)
+    rows = db.session.execute(
+        select(ExchangeRate.currency, ExchangeRate.rate, ExchangeRate.fetched_at)
+        .where(ExchangeRate.base == base, ExchangeRate.fetched_at == newest.scalar_subquery())
+    ).all()
+    if not rows:
+        return None
+    return {row.currency: row.rate for row in rows}, rows[0].fetched_at
+
+
+def init_app(app):
+    app.config.setdefault('EXCHANGE_RATE_PERSIST', True)
+    rate_cache = app.extensions.get('rate_cache')
+    if rate_cache is not None and rate_cache.store is None and app.config['EXCHANGE_RATE_PERSIST']:
+        rate_cache.store = DatabaseRateStore(app)
+
+
+def prefetch_rates(app):
+    rate_cache = app.extensions['rate_cache']
+    try:
+        table = rate_cache.refresh_now()
+    except Exception as e:
+        print(f"Exchange rate prefetch failed: {e}")
+        return None
+    if not table:
+        print("Exchange rate prefetch returned no rates")
+    return table
+
+
+def rate_at(from_currency, to_currency, at, base=None):
+    """Rate from ``from_currency`` to ``to_currency`` in effect at ``at``.
+
+    Returns ``(rate, fetched_at)`` from the newest snapshot taken at or
+    before ``at``, or ``(None, None)`` when there is none. Call inside an
+    app context.
+    """
+    from_currency = from_currency.upper()
+    to_currency = to_currency.upper()
+    if from_currency == to_currency:
+        return 1.0, None
+
+    base = (base or current_app.config.get('EXCHANGE_RATE_BASE', 'EUR')).upper()
+    snapshot = _snapshot(base, at or datetime.utcnow())
+    if not snapshot:
+        return None, None
+    table, fetched_at = snapshot
+    from_rate = table.get(from_currency)
+    to_rate = table.get(to_currency)
+    if not from_rate or to_rate is None:
+        return None, fetched_at
+    return to_rate / from_rate, fetched_at
@@ -0,0 +1,255 @@
+import threading
+import time
+from datetime import datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.metrics import EXCHANGE_RATE_FETCH_SECONDS
+
+
+class FrankfurterProvider:
+    def __init__(self, base_url='https://api.frankfurter.app', connect_timeout=3.05,
+                 read_timeout=5, pool_size=10):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        # One pooled session per process so refreshes reuse the TLS connection
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def fetch_table(self, base):
+        response = self.session.get(
+            f"{self.base_url}/latest",
+            params={'from': base},
+            timeout=self.timeout
+        )
+        response.raise_for_status()
+        table = dict(response.json().get('rates', {}))
+        table[base] = 1.0
+        return table
+
+
+class StubProvider:
+    # Local stand-in for tests and benchmarks, never touches the network.
+    # Rates are given against the configured base currency.
+    def __init__(self, rates=None, base='EUR'):
+        self.base = base.upper()
+        self.rates = {currency.upper(): rate for currency, rate in (rates or {}).items()}
+        self.rates[self.base] = 1.0
+        self.calls = 0
+
+    def fetch_table(self, base):
+        self.calls += 1
+        if base not in self.rates:
+            return None
+        pivot = self.rates[base]
+        return {currency: rate / pivot for currency, rate in self.rates.items()}
+
+
+def make_provider(config):
+    name = config.get('EXCHANGE_RATE_PROVIDER', 'frankfurter')
+    if name == 'stub':
+        return StubProvider(config.get('EXCHANGE_RATE_STUB_RATES'),
+                            base=config.get('EXCHANGE_RATE_BASE', 'EUR'))
+    if name == 'frankfurter':
+        return FrankfurterProvider(
+            base_url=config.get('EXCHANGE_RATE_API_URL', 'https://api.frankfurter.app'),
+            connect_timeout=config.get('EXCHANGE_RATE_CONNECT_TIMEOUT', 3.05),
+            read_timeout=config.get('EXCHANGE_RATE_READ_TIMEOUT', 5),
+            pool_size=config.get('EXCHANGE_RATE_POOL_SIZE', 10)
+        )
+    raise ValueError(f"Unknown exchange rate provider: {name}")
+
+
+class RateCache:
+    """Process-wide exchange rate tables keyed by base currency.
+
+    One upstream call fetches every rate against ``base``; any pair,
+    including inverse rates, is derived from that table by triangulation.
+    Fresh tables are served directly. Tables older than ``ttl`` but
+    younger than ``ttl + stale_ttl`` are served stale while a single
+    background refresh runs. Concurrent misses share one upstream call.
+    When a refresh fails, the last table keeps being served without
+    blocking and upstream is not called again for ``retry_seconds``.
+
+    With a ``store`` (see ``app.rate_history``), a refresh first takes a
+    snapshot persisted by another process if it is still fresh, and falls
+    back to the latest persisted snapshot when upstream is down, so a cold
+    process can convert without reaching the API.
+    """
+
+    def __init__(self, provider=None, base='EUR', ttl=300, stale_ttl=3600, store=None, retry_seconds=30):
+        self.provider = provider
+        self.base = base
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.store = store
+        self.retry_seconds = retry_seconds
+        self._retry_at = {}
+        self._entries = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.errors = 0
+
+    def init_app(self, app):
+        app.config.setdefault('EXCHANGE_RATE_BASE', self.base)
+        app.config.setdefault('EXCHANGE_RATE_TTL', self.ttl)
+        app.config.setdefault('EXCHANGE_RATE_STALE_TTL', self.stale_ttl)
+        app.config.setdefault('EXCHANGE_RATE_RETRY_SECONDS', self.retry_seconds)
+        self.base = app.config['EXCHANGE_RATE_BASE'].upper()
+        self.ttl = app.config['EXCHANGE_RATE_TTL']
+        self.stale_ttl = app.config['EXCHANGE_RATE_STALE_TTL']
+        self.retry_seconds = app.config['EXCHANGE_RATE_RETRY_SECONDS']
+        if self.provider is None:
+            self.provider = make_provider(app.config)
+        app.extensions['rate_cache'] = self
+
+    def get(self, from_currency, to_currency):
+        from_currency = from_currency.upper()
+        to_currency = to_currency.upper()
+        if from_currency == to_currency:
+            return 1.0
+
+        table = self.table()
+        if not table:
+            return None
+        from_rate = table.get(from_currency)
+        to_rate = table.get(to_currency)
+        if not from_rate or to_rate is None:
+            return None
+        return to_rate / from_rate
+
+    def table(self, base=None):
+        base = (base or self.base).upper()
+        with self._lock:
+            entry = self._entries.get(base)
+            if entry is not None:
+                age = time.monotonic() - entry[1]
+                if age < self.ttl:
+                    self.hits += 1
+                    return entry[0]
+                # After a failed refresh the last table is served at any age, upstream
+                # is retried in the background once the backoff has passed
+                if age < self.ttl + self.stale_ttl or base in self._retry_at:
+                    self.stale_hits += 1
+                    if time.monotonic() >= self._retry_at.get(base, 0):
+                        event, leader = self._begin(base)
+                        if leader:
+                            threading.Thread(target=self._refresh, args=(base, event), daemon=True).start()
+                    return entry[0]
+            self.misses += 1
+            if time.monotonic() < self._retry_at.get(base, 0):
+                # Nothing to serve and upstream just failed, don't wait on it again yet
+                return None
+            event, leader = self._begin(base)
+
+        if leader:
+            return self._refresh(base, event)
+
+        event.wait()
+        return self._cached(base)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'stale_hits': self.stale_hits,
+                'errors': self.errors,
+                'entries': len(self._entries)
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def refresh_now(self, base=None):
+        # Fetch from upstream regardless of age and persist the snapshot (prefetch job)
+        base = (base or self.base).upper()
+        with EXCHANGE_RATE_FETCH_SECONDS.time(outcome='ok'):
+            table = self.provider.fetch_table(base)
+        if not table:
+            return None
+        self._remember(base, table, time.monotonic())
+        self._persist(base, table)
+        return table
+
+    # Must be called with self._lock held
+    def _begin(self, base):
+        event = self._inflight.get(base)
+        if event is not None:
+            return event, False
+        event = self._inflight[base] = threading.Event()
+        return event, True
+
+    def _cached(self, base):
+        with self._lock:
+            entry = self._entries.get(base)
+        return entry[0] if entry else None
+
+    def _remember(self, base, table, fetched_at):
+        with self._lock:
+            if time.monotonic() - fetched_at < self.ttl:
+                self._retry_at.pop(base, None)
+            entry = self._entries.get(base)
+            if entry is None or entry[1] <= fetched_at:
+                self._entries[base] = (table, fetched_at)
+
+    def _persist(self, base, table):
+        if self.store is None:
+            return
+        try:
+            self.store.save(base, table, datetime.utcnow())
+        except Exception as e:
+            print(f"Error storing exchange rates: {e}")
+
+    def _stored(self, base):
+        # Latest persisted snapshot as (table, monotonic fetch time), or None
+        try:
+            snapshot = self.store.latest(base)
+        except Exception as e:
+            print(f"Error loading stored exchange rates: {e}")
+            return None
+        if not snapshot:
+            return None
+        table, fetched_at = snapshot
+        age = (datetime.utcnow() - fetched_at).total_seconds()
+        return table, time.monotonic() - age
+
+    def _refresh(self, base, event):
+        try:
+            stored = self._stored(base) if self.store is not None else None
+            if stored and time.monotonic() - stored[1] < self.ttl:
+                # Another process (the prefetch job) already has a fresh one
+                self._remember(base, *stored)
+                return self._cached(base)
+
+            try:
+                with EXCHANGE_RATE_FETCH_SECONDS.time(outcome='ok'):
+                    table = self.provider.fetch_table(base)
+            except Exception as e:
+                print(f"Error fetching exchange rates: {e}")
+                table = None
+
+            if not table:
+                with self._lock:
+                    self.errors += 1
+                    self._retry_at[base] = time.monotonic() + self.retry_seconds
+                # Upstream is down, keep serving the last known table
+                if stored and self._cached(base) is None:
+                    self._remember(base, *stored)
+                return self._cached(base)
+
+            self._remember(base, table, time.monotonic())
+            # Every table actually used is on record, so audits see the rate a purchase got
+            self._persist(base, table)
+            return table
+        finally:
+            with self._lock:
+                self._inflight.pop(base, None)
+            event.set()
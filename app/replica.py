@@ -0,0 +1,29 @@
+from functools import wraps
+
+from flask import g, has_request_context
+from flask_sqlalchemy.session import Session
+
+
+class RoutingSession(Session):
+    """Sends reads of replica-marked requests to the 'replica' bind.
+
+    Only views decorated with ``use_replica`` are routed, and never while
+    flushing, so writes and settlement always use the primary. Without a
+    configured replica everything stays on the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_request_context() and g.get('use_replica'):
+            replica = self._db.engines.get('replica')
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def use_replica(view):
+    # For read-only endpoints that can tolerate replication lag
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.use_replica = True
+        return view(*args, **kwargs)
+    return wrapper
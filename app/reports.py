@@ -0,0 +1,69 @@
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+
+from app import db
+from app.models import Product, SalesDaily
+
+GROUP_COLUMNS = {
+    'day': SalesDaily.day,
+    'product': SalesDaily.product_id,
+    'currency': SalesDaily.currency,
+}
+
+
+def record_sales(totals):
+    # totals: {(day, product_id, currency): (count, revenue)}, one upsert for the whole chunk
+    if not totals:
+        return
+    stmt = insert(SalesDaily).values([
+        {'day': day, 'product_id': product_id, 'currency': currency,
+         'sales_count': count, 'revenue': revenue}
+        for (day, product_id, currency), (count, revenue) in totals.items()
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['day', 'product_id', 'currency'],
+        set_={
+            'sales_count': SalesDaily.sales_count + stmt.excluded.sales_count,
+            'revenue': SalesDaily.revenue + stmt.excluded.revenue,
+        }
+    )
+    db.session.execute(stmt)
+
+
+def sales_report(group_by, date_from=None, date_to=None, currency=None):
+    # Revenue is never summed across currencies, so currency is always a dimension
+    dimensions = [d for d in group_by if d != 'currency'] + ['currency']
+    columns = [GROUP_COLUMNS[d] for d in dimensions]
+
+    query = db.session.query(
+        *columns,
+        func.sum(SalesDaily.sales_count).label('sales_count'),
+        func.sum(SalesDaily.revenue).label('revenue')
+    )
+    if date_from:
+        query = query.filter(SalesDaily.day >= date_from)
+    if date_to:
+        query = query.filter(SalesDaily.day < date_to)
+    if currency:
+        query = query.filter(SalesDaily.currency == currency.upper())
+    rows = query.group_by(*columns).order_by(*columns).all()
+
+    product_names = {}
+    if 'product' in dimensions:
+        product_ids = {row.product_id for row in rows}
+        product_names = dict(db.session.query(Product.id, Product.product_name)
+                             .filter(Product.id.in_(product_ids)))
+
+    report = []
+    for row in rows:
+        entry = {}
+        if 'day' in dimensions:
+            entry['day'] = row.day.isoformat()
+        if 'product' in dimensions:
+            entry['product_id'] = row.product_id
+            entry['product_name'] = product_names.get(row.product_id)
+        entry['currency'] = row.currency
+        entry['sales_count'] = int(row.sales_count)
+        entry['revenue'] = round(row.revenue, 2)
+        report.append(entry)
+    return report
@@ -1,14 +1,32 @@
-from flask import Blueprint, jsonify, request
-from app import db, mail
+from flask import Blueprint, current_app, jsonify, request
+from app import db, rate_cache, catalog_cache, price_matrix
 from app.models import User, Product, Card, Account, Purchase, PurchaseStatus
+from app.settlement import announce_new_purchase, wake_settler
+from app.outbox import enqueue_email
+from app.accounts import convert_balance, credit_account
+from app.stock import release_stock, reserve_stock
+from app.quotes import InvalidQuote, issue_quote, load_quote
+from app.reports import GROUP_COLUMNS, sales_report
+from app.rate_history import rate_at
+from app.valuation import net_worth_page, rate_factors
+from app.auth import (AccessDenied, admin_required, attach_refreshed_token, caller_id, issue_refresh_token,
+                      issue_token, resolve_user_id, user_is_verified)
+from app.replica import use_replica
+from app.idempotency import commit_with_response, idempotent
+from app.pagination import InvalidPageRequest, decode_cursor, encode_cursor, keyset_page, page_limit, parse_date
+from app.serialization import json_list_response
 from werkzeug.security import check_password_hash, generate_password_hash
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
-from flask_mail import Message,Mail
+from flask_jwt_extended import jwt_required
 from datetime import datetime
-import requests
-from apscheduler.schedulers.background import BackgroundScheduler
+from sqlalchemy import tuple_
 
 main = Blueprint('main', __name__)
+main.after_request(attach_refreshed_token)
+
+
+@main.errorhandler(AccessDenied)
+def handle_access_denied(e):
+    return jsonify({'error': str(e)}), 403
 
 @main.route('/')
 def home():
@@ -21,9 +39,6 @@ def login():
     email = data.get('email')
     password = data.get('password')
 
-    print(email)
-    print(password)
-
     if not email or not password:
         return jsonify({'error': 'Missing email or password'}), 400
 
@@ -36,17 +51,25 @@ def login():
     if not user or not check_password_hash(user.password, password):
         return jsonify({'error': 'Invalid credentials'}), 401
 
-    # Still returning JWT token if needed for frontend
-    access_token = create_access_token(identity={
-        'id': user.id,
-        'email': user.email,
-        'is_admin': user.is_admin
-    })
+    # Routes authorize from the token claims, no per-request user lookup
+    access_token = issue_token(user)
+
+    return jsonify({'access_token': access_token, 'refresh_token': issue_refresh_token(user)}), 200
 
-    return jsonify({'access_token': access_token}), 200
+@main.route('/token/refresh', methods=['POST'])
+@jwt_required(refresh=True)
+def refresh_token():
+    # New access token with current claims, only in exchange for a refresh token
+    user = User.query.get(caller_id())
+    if not user:
+        return jsonify({"error": "User not found"}), 404
+    return jsonify({'access_token': issue_token(user)}), 200
 
 @main.route('/users/<int:id>', methods=['GET'])
+@jwt_required()
+@use_replica
 def get_user_by_id(id):
+    id = resolve_user_id(id)
     user = User.query.get(id)
     if not user:
         return jsonify({"error": "User not found"}), 404
@@ -65,7 +88,9 @@ def get_user_by_id(id):
     })
 
 @main.route('/update-account/<int:id>', methods=['PATCH'])
+@jwt_required()
 def update_user_account(id):
+    id = resolve_user_id(id)
     user = User.query.get(id)
     if not user:
         return jsonify({"error": "User not found"}), 404
@@ -116,41 +141,92 @@ def register():
         phone_number=data.get('phone_number'),
         email=data.get('email'),
         password=hashed_password,
-        is_admin=data.get('is_admin', False),
+        is_admin=False,  # admins are never self-registered, the token claim grants admin access
         is_verified=False
     )
 
     db.session.add(user)
+    # Mail goes through the outbox and commits with the user row
+    enqueue_email(
+        'New User Registered',
+        ['tatjanakosic14@gmail.com'],
+        f'A new admin user has registered:\n\nName: {user.name} {user.surname}\nEmail: {user.email}'
+    )
     db.session.commit()
 
-    #slanje mejla
-    # Slanje mejla u try-except bloku
-    try:
-        msg = Message(
-            'New User Registered',
-            recipients=['tatjanakosic14@gmail.com'],
-            body=f'A new admin user has registered:\n\nName: {user.name} {user.surname}\nEmail: {user.email}'
-        )
-        mail.send(msg)  # Pokušaj slanja mejla
-    except Exception as e:
-        # Ako dođe do greške pri slanju mejla, vrati grešku sa opisom
-        return jsonify({'error': 'Failed to send email', 'details': str(e)}), 500
-
-
     return jsonify({'message': 'User registered successfully!'}), 201
 
+def _load_prices():
+    return db.session.query(Product.id, Product.price, Product.currency).all()
+
+def _price_table():
+    # Every product in every currency, rebuilt only when rates or products change
+    return price_matrix.current(rate_cache.table(), _load_prices)
+
+def _render_catalog(prices=None, currency=None):
+    # Plain column rows, no ORM entities to build and track for the whole catalog
+    products = db.session.query(
+        Product.id,
+        Product.product_name,
+        Product.price,
+        Product.quantity,
+        Product.currency
+    ).all()
+    if currency is None:
+        return current_app.json.dumps([{
+            'id': p.id,
+            'product_name': p.product_name,
+            'price': p.price,
+            'quantity': p.quantity,
+            'currency': p.currency
+        } for p in products]).encode() + b'\n'
+
+    items = []
+    for p in products:
+        if p.currency == currency:
+            price = p.price
+        else:
+            price = prices.price(p.id, currency, p.price, p.currency)
+            if price is None:
+                price = prices.convert(p.price, p.currency, currency)
+        items.append({
+            'id': p.id,
+            'product_name': p.product_name,
+            'price': price,
+            'quantity': p.quantity,
+            'currency': currency,
+            'original_price': p.price,
+            'original_currency': p.currency
+        })
+    return current_app.json.dumps(items).encode() + b'\n'
+
 @main.route('/products', methods=['GET'])
+@use_replica
 def get_products():
-    products = Product.query.all()
-    return jsonify([{
-        'id': p.id,
-        'product_name': p.product_name,
-        'price': p.price,
-        'quantity': p.quantity,
-        'currency': p.currency
-    } for p in products]), 200
+    currency = request.args.get('currency')
+    if currency:
+        currency = currency.upper()
+        prices = _price_table()
+        if prices is None:
+            return jsonify({'error': 'Exchange rates not available'}), 503
+        if currency not in prices.currency_index:
+            return jsonify({'error': f'Unsupported currency {currency}'}), 400
+        snapshot = catalog_cache.snapshot(lambda: _render_catalog(prices, currency),
+                                          key=(currency, prices.version))
+    else:
+        snapshot = catalog_cache.snapshot(_render_catalog)
+
+    # Repeat clients get a 304 straight from the in-process snapshot. Weak comparison
+    # (RFC 7232), proxies that compress the body send the tag back as W/"..."
+    if request.if_none_match.contains_weak(snapshot.etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = current_app.response_class(snapshot.body, status=200, mimetype='application/json')
+    response.set_etag(snapshot.etag)
+    return response
 
 @main.route('/create-product', methods=['POST'])
+@admin_required
 def add_product():
     data = request.get_json()
     new_product = Product(
@@ -161,25 +237,37 @@ def add_product():
     )
     db.session.add(new_product)
     db.session.commit()
+    catalog_cache.invalidate()
+    price_matrix.invalidate()
     return jsonify({'message': 'Product created successfully'}), 201
 
 @main.route('/products/<int:product_id>/quantity', methods=['PATCH'])
+@admin_required
 def update_quantity(product_id):
-    data = request.get_json()
-    product = Product.query.get_or_404(product_id)
-    product.quantity += data.get('quantity', 0)
+    data = request.get_json() or {}
+    try:
+        quantity = int(data.get('quantity', 0))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid quantity'}), 400
+
+    # Single increment, a read-modify-write here could undo a concurrent reservation
+    if not release_stock({product_id: quantity}):
+        db.session.rollback()
+        return jsonify({'error': 'Product not found'}), 404
     db.session.commit()
+    catalog_cache.invalidate()
     return jsonify({'message': 'Quantity updated successfully'}), 200
 
 @main.route('/add-newcard', methods=['POST'])
+@jwt_required()
 def add_card():
     data = request.get_json()
 
-    if not all(k in data for k in ('cardNumber', 'expiry', 'cvv', 'user_id')):
+    if not all(k in data for k in ('cardNumber', 'expiry', 'cvv')):
         return jsonify({"error": "Missing required fields"}), 400
 
     new_card = Card(
-        user_id=data['user_id'],
+        user_id=resolve_user_id(data.get('user_id')),
         number=data['cardNumber'],
         expiry=data['expiry'],
         cvv=data['cvv']
@@ -190,7 +278,9 @@ def add_card():
     return jsonify({"message": "Card added successfully."}), 201
 
 @main.route('/get-user-card/<int:user_id>', methods=['GET'])
+@jwt_required()
 def get_user_card(user_id):
+    user_id = resolve_user_id(user_id)
     card = Card.query.filter_by(user_id=user_id).first()
     if card:
         return jsonify({'card': {
@@ -201,27 +291,58 @@ def get_user_card(user_id):
     return jsonify({'card': None}), 200
 
 @main.route('/users-with-cards-unverified', methods=['GET'])
+@admin_required
 def get_unverified_users_with_cards():
-    users = User.query.filter_by(is_verified=False).all()
-    data = []
-
-    for user in users:
-        cards = Card.query.filter_by(user_id=user.id).all()
-        if cards:
-            data.append({
-                'user_id': user.id,
-                'user_email': user.email,
-                'cards': [{
-                    'card_id': card.id,
-                    'card_number': card.number,
-                    'expiry': card.expiry,
-                    'cvv': card.cvv
-                } for card in cards]
-            })
+    try:
+        limit = page_limit(request.args)
+        cursor = request.args.get('cursor')
+        after_id = decode_cursor(cursor, int)[0] if cursor else 0
+    except InvalidPageRequest as e:
+        return jsonify({'error': str(e)}), 400
+
+    # One page of unverified users that have at least one card...
+    has_card = db.session.query(Card.id).filter(Card.user_id == User.id).exists()
+    page = db.session.query(User.id, User.email)\
+        .filter(User.is_verified == False, User.id > after_id, has_card)\
+        .order_by(User.id)\
+        .limit(limit + 1)\
+        .subquery()
+
+    # ...joined with their cards, all in a single statement
+    rows = db.session.query(
+        page.c.id.label('user_id'),
+        page.c.email.label('user_email'),
+        Card.id.label('card_id'),
+        Card.number,
+        Card.expiry,
+        Card.cvv
+    ).join(Card, Card.user_id == page.c.id
+    ).order_by(page.c.id, Card.id).all()
+
+    users = {}
+    for row in rows:
+        user = users.setdefault(row.user_id, {
+            'user_id': row.user_id,
+            'user_email': row.user_email,
+            'cards': []
+        })
+        user['cards'].append({
+            'card_id': row.card_id,
+            'card_number': row.number,
+            'expiry': row.expiry,
+            'cvv': row.cvv
+        })
+
+    data = list(users.values())
+    next_cursor = None
+    if len(data) > limit:
+        data = data[:limit]
+        next_cursor = encode_cursor(data[-1]['user_id'])
 
-    return jsonify(data), 200
+    return jsonify({'items': data, 'next_cursor': next_cursor}), 200
 
 @main.route('/verify-user/<int:user_id>', methods=['PUT'])
+@admin_required
 def verify_user(user_id):
     user = User.query.get(user_id)
     if not user:
@@ -230,69 +351,197 @@ def verify_user(user_id):
     db.session.commit()
     return jsonify({'message': 'User verified successfully'}), 200
 
+@main.route('/verify-users', methods=['PUT'])
+@admin_required
+def verify_users():
+    data = request.get_json() or {}
+    user_ids = data.get('user_ids')
+
+    if not isinstance(user_ids, list) or not user_ids:
+        return jsonify({'error': 'user_ids must be a non-empty list'}), 400
+    try:
+        user_ids = {int(user_id) for user_id in user_ids}
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid user id'}), 400
+
+    # Single UPDATE for the whole list
+    verified = User.query\
+        .filter(User.id.in_(user_ids))\
+        .update({User.is_verified: True}, synchronize_session=False)
+    db.session.commit()
+
+    return jsonify({'message': 'Users verified successfully', 'verified': verified}), 200
+
 @main.route('/deposit-to-account', methods=['POST'])
+@jwt_required()
+@idempotent
 def deposit():
     data = request.get_json()
-    user_id = data.get('user_id')
+    user_id = resolve_user_id(data.get('user_id'))
     currency = data.get('currency')
     amount = data.get('amount')
 
     if not all([user_id, currency, amount]):
         return jsonify({'error': 'Missing fields'}), 400
 
-    account = Account.query.filter_by(user_id=user_id, currency=currency).first()
-
-    if not account:
-        account = Account(user_id=user_id, currency=currency, balance=0.0)
-        db.session.add(account)
+    try:
+        amount = float(amount)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid amount'}), 400
 
-    account.balance += float(amount)
-    db.session.commit()
+    new_balance = credit_account(user_id, currency, amount)
 
-    return jsonify({
+    return commit_with_response({
         'message': 'Deposit successful',
         'currency': currency,
-        'new_balance': account.balance
-    }), 200
+        'new_balance': new_balance
+    }, 200)
 
 @main.route('/get-user-accounts/<int:user_id>', methods=['GET'])
+@jwt_required()
+@use_replica
 def get_user_accounts(user_id):
-    accounts = Account.query.filter_by(user_id=user_id).all()
+    user_id = resolve_user_id(user_id)
+    accounts = db.session.query(Account.currency, Account.balance).filter_by(user_id=user_id).all()
 
-    account_list = [{
+    return json_list_response(accounts, lambda acc: {
         'currency': acc.currency,
         'balance': acc.balance
-    } for acc in accounts]
+    })
+
+
+@main.route('/users/<int:user_id>/net-worth', methods=['GET'])
+@jwt_required()
+@use_replica
+def get_net_worth(user_id):
+    user_id = resolve_user_id(user_id)
+    currency = (request.args.get('currency') or '').upper()
+    if not currency:
+        return jsonify({'error': 'Missing currency'}), 400
+
+    # One rate table for every account, no per-account lookups
+    table = rate_cache.table()
+    if not table:
+        return jsonify({'error': 'Exchange rates not available'}), 503
+    factors = rate_factors(table, currency)
+    if not factors:
+        return jsonify({'error': f'Exchange rate not available for {currency}'}), 400
+
+    accounts = db.session.query(Account.currency, Account.balance).filter_by(user_id=user_id).all()
+    breakdown = []
+    total = 0.0
+    unpriced = 0
+    for acc in accounts:
+        factor = factors.get(acc.currency.upper())
+        if factor is None:
+            # Same as /admin/net-worth: left out of the total and counted
+            unpriced += 1
+            breakdown.append({
+                'currency': acc.currency,
+                'balance': acc.balance,
+                'rate': None,
+                'value': None,
+                'priced': False
+            })
+            continue
+        value = (acc.balance or 0.0) * factor
+        total += value
+        breakdown.append({
+            'currency': acc.currency,
+            'balance': acc.balance,
+            'rate': factor,
+            'value': round(value, 2),
+            'priced': True
+        })
 
-    return jsonify(account_list), 200
+    return jsonify({
+        'user_id': user_id,
+        'currency': currency,
+        'total': round(total, 2),
+        'unpriced_accounts': unpriced,
+        'accounts': breakdown
+    }), 200
+
+@main.route('/admin/net-worth', methods=['GET'])
+@admin_required
+@use_replica
+def get_all_net_worth():
+    currency = (request.args.get('currency') or '').upper()
+    if not currency:
+        return jsonify({'error': 'Missing currency'}), 400
+    try:
+        limit = page_limit(request.args)
+        cursor = request.args.get('cursor')
+        after_id = decode_cursor(cursor, int)[0] if cursor else 0
+    except InvalidPageRequest as e:
+        return jsonify({'error': str(e)}), 400
+
+    table = rate_cache.table()
+    if not table:
+        return jsonify({'error': 'Exchange rates not available'}), 503
+    if currency not in table:
+        return jsonify({'error': f'Exchange rate not available for {currency}'}), 400
+
+    # Summed in SQL for the whole page in one statement
+    rows = net_worth_page(currency, table, after_id, limit)
+    next_cursor = encode_cursor(rows[limit - 1].user_id) if len(rows) > limit else None
+
+    return json_list_response(rows[:limit], lambda row: {
+        'user_id': row.user_id,
+        'currency': currency,
+        'total': round(row.total, 2),
+        'unpriced_accounts': int(row.unpriced_accounts)
+    }, envelope={'next_cursor': next_cursor})
 
 
 # dobavaljanje trenutne kursne liste
 
 def get_exchange_rate(from_currency, to_currency):
+    return rate_cache.get(from_currency, to_currency)
+
+    
+@main.route('/convert/quote', methods=['POST'])
+def quote_conversion():
+    data = request.get_json() or {}
+    from_currency = data.get('from_currency')
+    to_currency = data.get('to_currency')
+    amount = data.get('amount')
+
+    if not all([from_currency, to_currency]):
+        return jsonify({'error': 'Missing fields'}), 400
+
     from_currency = from_currency.upper()
     to_currency = to_currency.upper()
 
-    url = f"https://api.frankfurter.app/latest?from={from_currency}&to={to_currency}"
-    try:
-        response = requests.get(url)
-        data = response.json()
-        print(f"Exchange rate API response: {data}")  # Debug
+    if from_currency == to_currency:
+        return jsonify({'error': 'Source and target currency must be different'}), 400
 
-        rate = data.get('rates', {}).get(to_currency)
-        if rate is None:
-            print(f"Rate for {from_currency} to {to_currency} not found in response.")
-            return None
-        return rate
-    except Exception as e:
-        print(f"Error fetching exchange rate: {e}")
-        return None
+    rate = get_exchange_rate(from_currency, to_currency)
+    if rate is None:
+        return jsonify({'error': 'Exchange rate not available for this currency pair'}), 400
+
+    token, expires_at = issue_quote('convert', from_currency=from_currency, to_currency=to_currency, rate=rate)
+    result = {
+        'from_currency': from_currency,
+        'to_currency': to_currency,
+        'rate': rate,
+        'quote_token': token,
+        'expires_at': expires_at
+    }
+    if amount is not None:
+        try:
+            result['converted_amount'] = round(float(amount) * rate, 2)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Invalid amount'}), 400
+
+    return jsonify(result), 200
 
-    
 @main.route('/convert', methods=['POST'])
+@jwt_required()
+@idempotent
 def convert_currency():
     data = request.get_json()
-    user_id = data.get('user_id')
+    user_id = resolve_user_id(data.get('user_id'))
     from_currency = data.get('from_currency')
     to_currency = data.get('to_currency')
     amount = data.get('amount')
@@ -303,9 +552,6 @@ def convert_currency():
     from_currency = from_currency.upper()
     to_currency = to_currency.upper()
 
-    print(from_currency)
-    print(to_currency)
-
     if from_currency == to_currency:
         return jsonify({'error': 'Source and target currency must be different'}), 400
 
@@ -316,38 +562,42 @@ def convert_currency():
     except (TypeError, ValueError):
         return jsonify({'error': 'Invalid amount'}), 400
 
-    rate = get_exchange_rate(from_currency, to_currency)
-    if rate is None:
-        return jsonify({'error': 'Exchange rate not available for this currency pair'}), 400
-
-    from_account = Account.query.filter_by(user_id=user_id, currency=from_currency).first()
-    to_account = Account.query.filter_by(user_id=user_id, currency=to_currency).first()
-
-    if not from_account or from_account.balance < amount:
-        return jsonify({'error': 'Insufficient funds or account not found'}), 400
-
-    if not to_account:
-        to_account = Account(user_id=user_id, currency=to_currency, balance=0.0)
-        db.session.add(to_account)
+    quote_token = data.get('quote_token')
+    if quote_token:
+        # Rate locked by /convert/quote, no lookup needed
+        try:
+            quote = load_quote(quote_token, 'convert')
+        except InvalidQuote as e:
+            return jsonify({'error': str(e)}), 400
+        if quote['from_currency'] != from_currency or quote['to_currency'] != to_currency:
+            return jsonify({'error': 'Quote does not match this conversion'}), 400
+        rate = quote['rate']
+    else:
+        rate = get_exchange_rate(from_currency, to_currency)
+        if rate is None:
+            return jsonify({'error': 'Exchange rate not available for this currency pair'}), 400
 
+    # One statement: id-ordered row locks, conditional debit and credit
     converted_amount = amount * rate
+    balances = convert_balance(user_id, from_currency, to_currency, amount, converted_amount)
+    if balances is None:
+        db.session.rollback()
+        return jsonify({'error': 'Insufficient funds or account not found'}), 400
+    new_balance_from, new_balance_to = balances
 
-    from_account.balance -= amount
-    to_account.balance += converted_amount
-
-    db.session.commit()
-
-    return jsonify({
+    return commit_with_response({
         'message': 'Conversion successful',
         'from_currency': from_currency,
         'to_currency': to_currency,
         'converted_amount': round(converted_amount, 2),
-        'new_balance_from_currency': from_account.balance,
-        'new_balance_to_currency': to_account.balance
-    }), 200
+        'new_balance_from_currency': new_balance_from,
+        'new_balance_to_currency': new_balance_to
+    }, 200)
 
 @main.route('/users/<int:id>/is_verified', methods=['GET'])
+@jwt_required()
 def check_user_verified(id):
+    id = resolve_user_id(id)
     user = User.query.get(id)
     if not user:
         return jsonify({"error": "User not found"}), 404
@@ -357,16 +607,69 @@ def check_user_verified(id):
         "is_verified": user.is_verified
     })
 
+def _purchase_price(product, currency):
+    # Konverzija cene ako je valuta različita
+    final_price = product.price
+    if product.currency != currency:
+        # Precomputed for every product and currency, same value a live conversion gives
+        prices = _price_table()
+        if prices is not None:
+            final_price = prices.price(product.id, currency, product.price, product.currency)
+            if final_price is not None:
+                return final_price, None
+            final_price = product.price
+
+        rate = get_exchange_rate(product.currency, currency)
+        if rate is None:
+            return None, "Currency conversion failed"
+        final_price *= rate
+        final_price = round(final_price, 2)  # Zaokруживање на 2 децимале
+    return final_price, None
+
+@main.route('/purchase/quote', methods=['POST'])
+def quote_purchase():
+    data = request.get_json() or {}
+    product_id = data.get('product_id')
+    currency = data.get('currency')
+
+    if not all([product_id, currency]):
+        return jsonify({"error": "Missing fields"}), 400
+
+    product = Product.query.get(product_id)
+    if not product:
+        return jsonify({"error": "Product not available"}), 400
+
+    final_price, error = _purchase_price(product, currency)
+    if error:
+        return jsonify({"error": error}), 500
+
+    token, expires_at = issue_quote(
+        'purchase',
+        product_id=product.id,
+        product_price=product.price,
+        product_currency=product.currency,
+        currency=currency,
+        amount=final_price
+    )
+    return jsonify({
+        "product_id": product.id,
+        "currency": currency,
+        "amount": final_price,
+        "quote_token": token,
+        "expires_at": expires_at
+    }), 200
+
 @main.route('/purchase', methods=['POST'])
+@jwt_required()
+@idempotent
 def create_purchase():
     data = request.get_json()
-    user_id = data.get('user_id')
+    user_id = resolve_user_id(data.get('user_id'))
     product_id = data.get('product_id')
     currency = data.get('currency')
 
-    # Provera korisnika
-    user = User.query.get(user_id)
-    if not user or not user.is_verified:
+    # Provera korisnika - iz JWT claim-a, bez upita ka bazi
+    if not user_is_verified(user_id):
         return jsonify({"error": "User not found or not verified"}), 400
 
     # Provera proizvoda i dostupnosti
@@ -379,19 +682,31 @@ def create_purchase():
     if not account:
         return jsonify({"error": f"No account with currency {currency}"}), 400
 
-    # Konverzija cene ako je valuta različita
-    final_price = product.price
-    if product.currency != currency:
-        rate = get_exchange_rate(product.currency, currency)
-        if rate is None:
-            return jsonify({"error": "Currency conversion failed"}), 500
-        final_price *= rate
-        final_price = round(final_price, 2)  # Zaokруживање на 2 децимале
+    quote_token = data.get('quote_token')
+    if quote_token:
+        # Price locked by /purchase/quote, valid only while the product price is unchanged
+        try:
+            quote = load_quote(quote_token, 'purchase')
+        except InvalidQuote as e:
+            return jsonify({"error": str(e)}), 400
+        if (quote['product_id'] != product.id or quote['currency'] != currency
+                or quote['product_price'] != product.price or quote['product_currency'] != product.currency):
+            return jsonify({"error": "Quote does not match this purchase"}), 400
+        final_price = quote['amount']
+    else:
+        final_price, error = _purchase_price(product, currency)
+        if error:
+            return jsonify({"error": error}), 500
 
     # Provera da li korisnik ima dovoljno sredstava
     if account.balance < final_price:
         return jsonify({"error": "Insufficient funds"}), 400
 
+    # Take the unit now, a sell-out is rejected here instead of failing in settlement
+    if reserve_stock(product.id) is None:
+        db.session.rollback()
+        return jsonify({"error": "Product not available"}), 400
+
     # Kreiranje kupovine sa statusom PENDING
     purchase = Purchase(
         user_id=user_id,
@@ -399,41 +714,174 @@ def create_purchase():
         currency=currency,
         amount=final_price,
         status=PurchaseStatus.PENDING.value,
-        created_at=datetime.utcnow()
+        created_at=datetime.utcnow(),
+        stock_reserved=True
     )
     db.session.add(purchase)
+    db.session.flush()
+    announce_new_purchase()
+    response = commit_with_response({
+        "message": f"Purchase created and pending. Final amount: {final_price} {currency}",
+        "purchase_id": purchase.id
+    }, 201)
+    catalog_cache.invalidate()
+    wake_settler()
+
+    return response
+
+@main.route('/purchase/batch', methods=['POST'])
+@jwt_required()
+def create_purchase_batch():
+    data = request.get_json() or {}
+    user_id = resolve_user_id(data.get('user_id'))
+    currency = data.get('currency')
+    items = data.get('items')
+
+    if not currency or not isinstance(items, list) or not items:
+        return jsonify({"error": "Missing fields"}), 400
+
+    # Same product may appear more than once in the cart
+    quantities = {}
+    try:
+        for item in items:
+            product_id = int(item['product_id'])
+            quantity = int(item.get('quantity', 1))
+            if quantity <= 0:
+                return jsonify({"error": "Quantity must be positive"}), 400
+            quantities[product_id] = quantities.get(product_id, 0) + quantity
+    except (KeyError, TypeError, ValueError, AttributeError):
+        return jsonify({"error": "Invalid items"}), 400
+
+    if not user_is_verified(user_id):
+        return jsonify({"error": "User not found or not verified"}), 400
+
+    # All products in one query
+    products = {p.id: p for p in Product.query.filter(Product.id.in_(quantities))}
+    for product_id, quantity in quantities.items():
+        product = products.get(product_id)
+        if not product or product.quantity < quantity:
+            return jsonify({"error": "Product not available", "product_id": product_id}), 400
+
+    account = Account.query.filter_by(user_id=user_id, currency=currency).first()
+    if not account:
+        return jsonify({"error": f"No account with currency {currency}"}), 400
+
+    # Prices come from the precomputed matrix
+    prices = {}
+    for product_id, product in products.items():
+        prices[product_id], error = _purchase_price(product, currency)
+        if error:
+            return jsonify({"error": error}), 500
+
+    total = round(sum(prices[product_id] * quantity for product_id, quantity in quantities.items()), 2)
+    if account.balance < total:
+        return jsonify({"error": "Insufficient funds"}), 400
+
+    # The whole cart is reserved or nothing is
+    for product_id, quantity in sorted(quantities.items()):
+        if reserve_stock(product_id, quantity) is None:
+            db.session.rollback()
+            return jsonify({"error": "Product not available", "product_id": product_id}), 400
+
+    # One PENDING purchase per unit, all in one transaction
+    now = datetime.utcnow()
+    purchases = [
+        Purchase(
+            user_id=user_id,
+            product_id=product_id,
+            currency=currency,
+            amount=prices[product_id],
+            status=PurchaseStatus.PENDING.value,
+            created_at=now,
+            stock_reserved=True
+        )
+        for product_id, quantity in quantities.items()
+        for _ in range(quantity)
+    ]
+    db.session.add_all(purchases)
+    db.session.flush()
+    purchase_ids = [purchase.id for purchase in purchases]
+    announce_new_purchase()
     db.session.commit()
+    catalog_cache.invalidate()
+    wake_settler()
 
     return jsonify({
-        "message": f"Purchase created and pending. Final amount: {final_price} {currency}",
-        "purchase_id": purchase.id
+        "message": f"{len(purchase_ids)} purchases created and pending. Total amount: {total} {currency}",
+        "purchase_ids": purchase_ids,
+        "total": total
     }), 201
 
+def _filter_purchases(query, args):
+    # Optional server-side filters shared by both history endpoints
+    status = args.get('status')
+    currency = args.get('currency')
+    date_from = parse_date(args.get('from'), 'from')
+    date_to = parse_date(args.get('to'), 'to')
+
+    if status:
+        query = query.filter(Purchase.status == status.lower())
+    if currency:
+        query = query.filter(Purchase.currency == currency.upper())
+    if date_from:
+        query = query.filter(Purchase.created_at >= date_from)
+    if date_to:
+        query = query.filter(Purchase.created_at < date_to)
+    return query
+
+
+def _purchase_page(query, args):
+    # Keyset pagination on (created_at, id): every page costs the same index range scan
+    limit = page_limit(args)
+    query = _filter_purchases(query, args)
+
+    cursor = args.get('cursor')
+    if cursor:
+        created_at, purchase_id = decode_cursor(cursor, datetime, int)
+        query = query.filter(tuple_(Purchase.created_at, Purchase.id) < (created_at, purchase_id))
+
+    query = query.order_by(Purchase.created_at.desc(), Purchase.id.desc())
+    return keyset_page(query, limit, lambda row: (row.created_at, row.id))
+
+
 @main.route('/get-purchase-history/<int:user_id>', methods=['GET'])
+@jwt_required()
+@use_replica
 def get_purchase_history(user_id):
-    purchases = db.session.query(Purchase, Product)\
-        .join(Product, Purchase.product_id == Product.id)\
-        .filter(Purchase.user_id == user_id)\
-        .all()
-
-    result = []
-    for purchase, product in purchases:
-        result.append({
-            'id': purchase.id,
-            'product_id': purchase.product_id,
-            'product_name': product.product_name,
-            'currency': purchase.currency,
-            'amount': purchase.amount,
-            'status': purchase.status,
-            'created_at': purchase.created_at.isoformat(),
-            'processed_at': purchase.processed_at.isoformat() if purchase.processed_at else None
-        })
+    user_id = resolve_user_id(user_id)
+    query = db.session.query(
+        Purchase.id,
+        Purchase.product_id,
+        Product.product_name,
+        Purchase.currency,
+        Purchase.amount,
+        Purchase.status,
+        Purchase.created_at,
+        Purchase.processed_at
+    ).join(Product, Purchase.product_id == Product.id
+    ).filter(Purchase.user_id == user_id)
 
-    return jsonify(result)
+    try:
+        purchases, next_cursor = _purchase_page(query, request.args)
+    except InvalidPageRequest as e:
+        return jsonify({'error': str(e)}), 400
+
+    return json_list_response(purchases, lambda p: {
+        'id': p.id,
+        'product_id': p.product_id,
+        'product_name': p.product_name,
+        'currency': p.currency,
+        'amount': p.amount,
+        'status': p.status,
+        'created_at': p.created_at.isoformat(),
+        'processed_at': p.processed_at.isoformat() if p.processed_at else None
+    }, envelope={'next_cursor': next_cursor})
 
 @main.route('/get-all-purchase-history', methods=['GET'])
+@admin_required
+@use_replica
 def get_all_purchase_history():
-    purchases = db.session.query(
+    query = db.session.query(
         Purchase.id,
         Purchase.amount,
         Purchase.currency,
@@ -443,77 +891,74 @@ def get_all_purchase_history():
         User.name.label('user_name'),
         Product.product_name
     ).join(User, Purchase.user_id == User.id
+    ).join(Product, Purchase.product_id == Product.id)
+
+    try:
+        purchases, next_cursor = _purchase_page(query, request.args)
+    except InvalidPageRequest as e:
+        return jsonify({'error': str(e)}), 400
+
+    return json_list_response(purchases, lambda p: {
+        'id': p.id,
+        'user_email': p.user_email,
+        'user_name': p.user_name,
+        'product_name': p.product_name,
+        'amount': p.amount,
+        'currency': p.currency,
+        'status': p.status,
+        'created_at': p.created_at.isoformat()
+    }, envelope={'next_cursor': next_cursor})
+
+@main.route('/admin/reports/sales', methods=['GET'])
+@admin_required
+@use_replica
+def get_sales_report():
+    # Served from the sales_daily rollup, never scans the purchase table
+    group_by = [d.strip() for d in request.args.get('group_by', 'day').split(',') if d.strip()]
+    unknown = [d for d in group_by if d not in GROUP_COLUMNS]
+    if unknown:
+        return jsonify({'error': f"Unknown group_by: {', '.join(unknown)}"}), 400
+
+    try:
+        date_from = parse_date(request.args.get('from'), 'from')
+        date_to = parse_date(request.args.get('to'), 'to')
+    except InvalidPageRequest as e:
+        return jsonify({'error': str(e)}), 400
+
+    report = sales_report(group_by,
+                          date_from=date_from.date() if date_from else None,
+                          date_to=date_to.date() if date_to else None,
+                          currency=request.args.get('currency'))
+    return json_list_response(report, lambda entry: entry)
+
+@main.route('/admin/purchases/<int:purchase_id>/rate', methods=['GET'])
+@admin_required
+@use_replica
+def audit_purchase_rate(purchase_id):
+    # Which stored rate was in effect when the purchase was made, and what it implies
+    row = db.session.query(
+        Purchase.id,
+        Purchase.currency,
+        Purchase.amount,
+        Purchase.created_at,
+        Product.price.label('product_price'),
+        Product.currency.label('product_currency')
     ).join(Product, Purchase.product_id == Product.id
-    ).order_by(Purchase.created_at.desc()).all()
+    ).filter(Purchase.id == purchase_id).first()
+    if not row:
+        return jsonify({'error': 'Purchase not found'}), 404
 
-    history = [
-        {
-            'id': p.id,
-            'user_email': p.user_email,
-            'user_name': p.user_name,
-            'product_name': p.product_name,
-            'amount': p.amount,
-            'currency': p.currency,
-            'status': p.status,
-            'created_at': p.created_at.isoformat()
-        }
-        for p in purchases
-    ]
+    rate, fetched_at = rate_at(row.product_currency, row.currency, row.created_at)
+    expected = round(row.product_price * rate, 2) if rate is not None else None
 
-    #current_app.logger.info("Purchase history response: %s", json.dumps(history, indent=2))
-
-    return jsonify(history), 200
-
-
-def process_pending_purchases(app):
-    with app.app_context():
-        pending_purchases = Purchase.query.filter_by(status=PurchaseStatus.PENDING.value).all()
-        if not pending_purchases:
-            return
-
-        admin_user = User.query.filter_by(is_admin=True).first()
-        if not admin_user:
-            print("No admin user found!")
-            return
-
-        admin_account = Account.query.filter_by(user_id=admin_user.id, currency='USD').first()
-        if not admin_account:
-            print("Admin account with USD not found!")
-            return
-
-        email_batches = []
-        batch_messages = []
-
-        for purchase in pending_purchases:
-            user_account = Account.query.filter_by(user_id=purchase.user_id, currency=purchase.currency).first()
-            product = Product.query.get(purchase.product_id)
-
-            if user_account and product and product.quantity > 0 and user_account.balance >= purchase.amount:
-                user_account.balance -= purchase.amount
-                admin_account.balance += purchase.amount
-                product.quantity -= 1
-                purchase.status = PurchaseStatus.COMPLETED.value
-                purchase.processed_at = datetime.utcnow()
-                db.session.commit()
-
-                batch_messages.append(
-                    f"Purchase ID {purchase.id}: User {purchase.user_id} bought {product.product_name} for {purchase.amount} {purchase.currency}"
-                )
-            else:
-                purchase.status = PurchaseStatus.FAILED.value
-                purchase.processed_at = datetime.utcnow()
-                db.session.commit()
-
-            if len(batch_messages) == 5:
-                email_batches.append('\n'.join(batch_messages))
-                batch_messages = []
-
-        if batch_messages:
-            email_batches.append('\n'.join(batch_messages))
-
-        for report in email_batches:
-            msg = Message(subject="Purchase Report",
-                          sender="noreply@yourdomain.com",
-                          recipients=["tatjanakosic14@gmail.com"],
-                          body=report)
-            mail.send(msg)
\ No newline at end of file
+    return jsonify({
+        'purchase_id': row.id,
+        'created_at': row.created_at.isoformat(),
+        'product_currency': row.product_currency,
+        'currency': row.currency,
+        'amount': row.amount,
+        'rate': rate,
+        'rate_fetched_at': fetched_at.isoformat() if fetched_at else None,
+        # Uses the product's current price, which may have changed since
+        'expected_amount': expected
+    }), 200
@@ -0,0 +1,70 @@
+from flask import current_app, stream_with_context
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional, the stdlib encoder is used without it
+    orjson = None
+
+STREAM_CHUNK_ROWS = 100
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson when it is installed.
+
+    Output matches the default provider: sorted keys, compact separators,
+    and dates still go through Flask's ``default`` hook. Anything orjson
+    can't take (custom dump arguments, e.g. indent in debug) falls back
+    to the stdlib encoder.
+    """
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            return orjson.dumps(obj, default=self.default, option=option).decode()
+        except TypeError:
+            return super().dumps(obj)
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+
+def json_list_response(rows, render, envelope=None, status=200):
+    """Render result rows as a JSON list, or as ``envelope`` with the list under 'items'.
+
+    Short lists go out as a normal response. Past JSON_STREAM_THRESHOLD
+    rows the body is streamed in chunks, so the full list of dicts and
+    the full string are never held in memory at once.
+    """
+    threshold = current_app.config.get('JSON_STREAM_THRESHOLD', 200)
+    if len(rows) <= threshold:
+        items = [render(row) for row in rows]
+        payload = items if envelope is None else dict(envelope, items=items)
+        response = current_app.json.response(payload)
+        response.status_code = status
+        return response
+
+    dumps = current_app.json.dumps
+    if envelope is None:
+        opening, closing = '[', ']'
+    else:
+        # 'items' sorts first, same key order jsonify would produce
+        rest = dumps(envelope)
+        opening = '{"items":['
+        closing = ']' + (',' + rest[1:] if len(rest) > 2 else '}')
+
+    def generate():
+        yield opening
+        for start in range(0, len(rows), STREAM_CHUNK_ROWS):
+            chunk = ','.join(dumps(render(row)) for row in rows[start:start + STREAM_CHUNK_ROWS])
+            yield chunk if start == 0 else ',' + chunk
+        yield closing + '\n'
+
+    return current_app.response_class(stream_with_context(generate()), status=status,
+                                      mimetype='application/json')
@@ -0,0 +1,338 @@
+import os
+import select as selectors
+import socket
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import or_, select, text, tuple_, update
+
+from app import db, catalog_cache
+from app.models import User, Product, Account, Purchase, PurchaseStatus
+from app.outbox import enqueue_email
+from app.reports import record_sales
+from app.stock import release_stock
+from app.metrics import SETTLEMENT_BATCH_SECONDS, SETTLEMENT_BATCH_SIZE
+
+
+NOTIFY_CHANNEL = 'purchase_created'
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def announce_new_purchase():
+    # Call inside the purchase transaction, Postgres delivers NOTIFY on commit
+    if db.session.get_bind().dialect.name == 'postgresql':
+        db.session.execute(text(f"NOTIFY {NOTIFY_CHANNEL}"))
+
+
+def wake_settler():
+    # Call after commit, wakes the settler running in this process (if any)
+    settler = current_app.extensions.get('settler')
+    if settler is not None:
+        settler.notify()
+
+
+class Settler:
+    """Settles purchases as soon as they are created.
+
+    The settler sleeps until it is woken, either in-process through
+    ``notify()`` or, with ``listen=True``, by a Postgres NOTIFY sent by
+    ``create_purchase`` in any process. After a wake-up it waits
+    ``SETTLEMENT_BATCH_WINDOW`` seconds so purchases arriving together are
+    settled in one pass. ``SETTLEMENT_SWEEP_SECONDS`` bounds the sleep as a
+    safety net for missed notifications and expired leases. When
+    ``should_run`` is given, passes are skipped while it returns False.
+    """
+
+    def __init__(self, app, worker_id=None, listen=False, should_run=None):
+        self.app = app
+        self.worker_id = worker_id or default_worker_id()
+        self.listen = listen
+        self.should_run = should_run
+        self.window = app.config.get('SETTLEMENT_BATCH_WINDOW', 0.2)
+        self.sweep_interval = app.config.get('SETTLEMENT_SWEEP_SECONDS', 60)
+        self._wake = threading.Event()
+        self._listener = None
+        self._thread = None
+        app.extensions['settler'] = self
+
+    def notify(self):
+        self._wake.set()
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run_forever, name='settler', daemon=True)
+        self._thread.start()
+        return self
+
+    def run_forever(self):
+        while True:
+            woken = self._wait(self.sweep_interval)
+            if woken and self.window:
+                # Micro-batch: let purchases created right after this one join the pass
+                time.sleep(self.window)
+                self._drain()
+            self._wake.clear()
+            if self.should_run is not None and not self.should_run():
+                continue
+
+            try:
+                process_pending_purchases(self.app, worker_id=self.worker_id)
+            except Exception as e:
+                print(f"Settlement pass failed: {e}")
+
+    def _wait(self, timeout):
+        if not self.listen:
+            return self._wake.wait(timeout)
+
+        try:
+            connection = self._listen_connection()
+            if self._wake.is_set():
+                return True
+            ready, _, _ = selectors.select([connection], [], [], timeout)
+            if ready:
+                connection.poll()
+                notified = bool(connection.notifies)
+                connection.notifies.clear()
+                return notified or self._wake.is_set()
+            return self._wake.is_set()
+        except Exception as e:
+            print(f"LISTEN {NOTIFY_CHANNEL} failed, falling back to polling: {e}")
+            self._close_listener()
+            return self._wake.wait(timeout)
+
+    def _drain(self):
+        if self._listener is not None:
+            try:
+                dbapi_connection = self._listen_connection()
+                dbapi_connection.poll()
+                dbapi_connection.notifies.clear()
+            except Exception:
+                self._close_listener()
+
+    def _listen_connection(self):
+        if self._listener is None:
+            with self.app.app_context():
+                raw = db.engine.raw_connection()
+            dbapi_connection = getattr(raw, 'driver_connection', None) or raw.connection
+            dbapi_connection.autocommit = True
+            dbapi_connection.cursor().execute(f"LISTEN {NOTIFY_CHANNEL}")
+            self._listener = (raw, dbapi_connection)
+        return self._listener[1]
+
+    def _close_listener(self):
+        if self._listener is not None:
+            try:
+                self._listener[0].invalidate()
+            except Exception:
+                pass
+            self._listener = None
+
+
+def process_pending_purchases(app, batch_size=None, worker_id=None):
+    """Settle PENDING purchases in leased chunks, one transaction per chunk.
+
+    Each chunk is first claimed by ``worker_id`` for
+    ``SETTLEMENT_LEASE_SECONDS``, so any number of workers can run this
+    concurrently and each settles a disjoint slice. Leases left behind by
+    a crashed worker expire and are claimed again. Returns the number of
+    purchases settled.
+    """
+    with app.app_context():
+        batch_size = batch_size or app.config.get('SETTLEMENT_BATCH_SIZE', 500)
+        lease_seconds = app.config.get('SETTLEMENT_LEASE_SECONDS', 120)
+        worker_id = worker_id or default_worker_id()
+        admin_id = None
+        settled = 0
+
+        while True:
+            started = time.perf_counter()
+            purchase_ids = claim_pending_purchases(worker_id, batch_size, lease_seconds)
+            if not purchase_ids:
+                break
+
+            if admin_id is None:
+                admin_user = User.query.filter_by(is_admin=True).first()
+                if not admin_user:
+                    print("No admin user found!")
+                    db.session.rollback()
+                    break
+                admin_id = admin_user.id
+
+            purchases = _lock_claimed(purchase_ids, worker_id)
+            result = _settle_chunk(purchases, admin_id)
+            if result is None:
+                db.session.rollback()
+                break
+            lines, stock_changed = result
+
+            if lines:
+                # Queued in the chunk's transaction, the outbox sender digests reports
+                enqueue_email("Purchase Report",
+                              ["tatjanakosic14@gmail.com"],
+                              '\n'.join(lines),
+                              sender="noreply@yourdomain.com",
+                              kind='purchase_report')
+            db.session.commit()
+            settled += len(purchases)
+            SETTLEMENT_BATCH_SIZE.observe(len(purchases))
+            SETTLEMENT_BATCH_SECONDS.observe(time.perf_counter() - started)
+            if stock_changed:
+                catalog_cache.invalidate()
+
+        return settled
+
+
+def claim_pending_purchases(worker_id, limit, lease_seconds):
+    now = datetime.utcnow()
+    claimable = select(Purchase.id)\
+        .where(Purchase.status == PurchaseStatus.PENDING.value)\
+        .where(or_(Purchase.claimed_until.is_(None), Purchase.claimed_until < now))\
+        .order_by(Purchase.id)\
+        .limit(limit)\
+        .with_for_update(skip_locked=True)\
+        .scalar_subquery()
+
+    result = db.session.execute(
+        update(Purchase)
+        .where(Purchase.id.in_(claimable))
+        .values(claimed_by=worker_id, claimed_until=now + timedelta(seconds=lease_seconds))
+        .returning(Purchase.id)
+        .execution_options(synchronize_session=False)
+    )
+    purchase_ids = [row[0] for row in result]
+    db.session.commit()
+    return purchase_ids
+
+
+def _lock_claimed(purchase_ids, worker_id):
+    # A lease that expired mid-run may have been claimed by someone else,
+    # only settle what this worker still holds
+    return Purchase.query\
+        .filter(Purchase.id.in_(purchase_ids))\
+        .filter(Purchase.claimed_by == worker_id)\
+        .filter_by(status=PurchaseStatus.PENDING.value)\
+        .order_by(Purchase.id)\
+        .with_for_update()\
+        .all()
+
+
+def _settle_chunk(purchases, admin_id):
+    # Lowest id wins, the same row filter_by(...).first() would have picked.
+    # Not locked: every worker credits it, so it only gets one UPDATE at the end.
+    admin_account_id = db.session.query(Account.id)\
+        .filter_by(user_id=admin_id, currency='USD')\
+        .order_by(Account.id)\
+        .scalar()
+    if admin_account_id is None:
+        print("Admin account with USD not found!")
+        return None
+
+    account_keys = {(p.user_id, p.currency) for p in purchases}
+    accounts = {}
+    for account in Account.query\
+            .filter(tuple_(Account.user_id, Account.currency).in_(account_keys))\
+            .order_by(Account.id)\
+            .with_for_update():
+        accounts.setdefault((account.user_id, account.currency), account)
+
+    product_ids = {p.product_id for p in purchases}
+    products = {
+        product.id: product
+        for product in Product.query
+            .filter(Product.id.in_(product_ids))
+            .order_by(Product.id)
+            .with_for_update()
+    }
+
+    lines = []
+    sales = {}
+    stock_changed = False
+    admin_total = 0.0
+    for purchase in purchases:
+        user_account = accounts.get((purchase.user_id, purchase.currency))
+        product = products.get(purchase.product_id)
+        # Reserved purchases already hold their unit
+        in_stock = product and (purchase.stock_reserved or product.quantity > 0)
+
+        if user_account and in_stock and user_account.balance >= purchase.amount:
+            user_account.balance -= purchase.amount
+            admin_total += purchase.amount
+            if not purchase.stock_reserved:
+                product.quantity -= 1
+                stock_changed = True
+            purchase.status = PurchaseStatus.COMPLETED.value
+            purchase.processed_at = datetime.utcnow()
+
+            lines.append(
+                f"Purchase ID {purchase.id}: User {purchase.user_id} bought {product.product_name} for {purchase.amount} {purchase.currency}"
+            )
+
+            key = (purchase.processed_at.date(), purchase.product_id, purchase.currency)
+            count, revenue = sales.get(key, (0, 0.0))
+            sales[key] = (count + 1, revenue + purchase.amount)
+        else:
+            purchase.status = PurchaseStatus.FAILED.value
+            purchase.processed_at = datetime.utcnow()
+            if purchase.stock_reserved and product:
+                # Give the reserved unit back
+                product.quantity += 1
+                purchase.stock_reserved = False
+                stock_changed = True
+
+        purchase.claimed_until = None
+
+    # Rollups move in the same transaction as the purchases they count
+    record_sales(sales)
+
+    if admin_total:
+        # Atomic increment, the row is only locked from here to the chunk's commit
+        db.session.execute(
+            update(Account)
+            .where(Account.id == admin_account_id)
+            .values(balance=Account.balance + admin_total)
+            .execution_options(synchronize_session=False)
+        )
+    return lines, stock_changed
+
+
+def expire_reservations(app, ttl=None):
+    """Fail pending purchases that have held reserved stock for longer than
+    ``PURCHASE_RESERVATION_TTL`` and give the stock back.
+
+    Purchases currently leased by a settlement worker are left alone.
+    Returns the number of purchases expired.
+    """
+    with app.app_context():
+        ttl = ttl or app.config.get('PURCHASE_RESERVATION_TTL', 900)
+        now = datetime.utcnow()
+        expired = select(Purchase.id)\
+            .where(Purchase.status == PurchaseStatus.PENDING.value)\
+            .where(Purchase.stock_reserved.is_(True))\
+            .where(Purchase.created_at < now - timedelta(seconds=ttl))\
+            .where(or_(Purchase.claimed_until.is_(None), Purchase.claimed_until < now))\
+            .with_for_update(skip_locked=True)\
+            .scalar_subquery()
+
+        result = db.session.execute(
+            update(Purchase)
+            .where(Purchase.id.in_(expired))
+            .values(status=PurchaseStatus.FAILED.value, processed_at=now,
+                    stock_reserved=False, claimed_until=None)
+            .returning(Purchase.product_id)
+            .execution_options(synchronize_session=False)
+        )
+        released = Counter(row[0] for row in result)
+        release_stock(released)
+        db.session.commit()
+
+        count = sum(released.values())
+        if count:
+            print(f"Expired {count} stale purchase reservations")
+            catalog_cache.invalidate()
+        return count
+
@@ -0,0 +1,34 @@
+from sqlalchemy import update
+
+from app import db
+from app.models import Product
+
+
+# Stock is taken when a purchase is created and given back if it fails,
+# each change is a single conditional statement so concurrent buyers
+# can never take more units than exist.
+
+def reserve_stock(product_id, quantity=1):
+    # Returns the remaining quantity, or None when the product is missing or sold out
+    stmt = update(Product)\
+        .where(Product.id == product_id,
+               Product.quantity >= quantity)\
+        .values(quantity=Product.quantity - quantity)\
+        .returning(Product.quantity)\
+        .execution_options(synchronize_session=False)
+    return db.session.execute(stmt).scalar_one_or_none()
+
+
+def release_stock(quantities):
+    # quantities: {product_id: units}, ordered by id so concurrent releases can't deadlock.
+    # Returns how many products matched.
+    matched = 0
+    for product_id, quantity in sorted(quantities.items()):
+        result = db.session.execute(
+            update(Product)
+            .where(Product.id == product_id)
+            .values(quantity=Product.quantity + quantity)
+            .execution_options(synchronize_session=False)
+        )
+        matched += result.rowcount
+    return matched
@@ -0,0 +1,41 @@
+from sqlalchemy import Float, String, case, column, func, values
+
+from app import db
+from app.models import Account
+
+
+# Balances valued in one currency. Every account is priced from the same
+# rate table, so totals never mix rates fetched at different moments.
+
+def rate_factors(table, currency):
+    # {account currency: multiplier into ``currency``}; empty when the target isn't quoted
+    target = table.get(currency)
+    if target is None:
+        return {}
+    return {code: target / rate for code, rate in table.items() if rate}
+
+
+def net_worth_page(currency, table, after_id=0, limit=50):
+    """Totals per user for one page of users with accounts, ordered by user id.
+
+    The factors go to the database as a VALUES list joined to account, so
+    the sum is computed in one grouped statement. Accounts in a currency
+    without a rate are left out of the total and counted in
+    ``unpriced_accounts``. Returns ``limit + 1`` rows so the caller can
+    tell whether another page exists.
+    """
+    factors = rate_factors(table, currency)
+    factor_table = values(
+        column('currency', String), column('factor', Float), name='rate_factor'
+    ).data(list(factors.items()))
+
+    return db.session.query(
+        Account.user_id,
+        func.coalesce(func.sum(Account.balance * factor_table.c.factor), 0.0).label('total'),
+        func.sum(case((factor_table.c.factor.is_(None), 1), else_=0)).label('unpriced_accounts')
+    ).outerjoin(factor_table, factor_table.c.currency == func.upper(Account.currency)
+    ).filter(Account.user_id > after_id
+    ).group_by(Account.user_id
+    ).order_by(Account.user_id
+    ).limit(limit + 1
+    ).all()
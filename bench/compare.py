@@ -0,0 +1,33 @@
+"""Compare two benchmark result files: python -m bench.compare old.json new.json"""
+import json
+import sys
+
+# For these lower is better, for the rest higher is better
+LOWER_IS_BETTER = ('_ms', 'duration_s', 'errors', 'sql_statements')
+
+
+def main(old_path, new_path):
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+
+    print(f"{old['revision']} -> {new['revision']}")
+    for scenario, new_metrics in new['results'].items():
+        old_metrics = old['results'].get(scenario, {})
+        print(f"\n{scenario}")
+        for metric, new_value in new_metrics.items():
+            old_value = old_metrics.get(metric)
+            if not isinstance(new_value, (int, float)) or not isinstance(old_value, (int, float)):
+                print(f"  {metric:28} {old_value!s:>12} -> {new_value!s:>12}")
+                continue
+            change = (new_value - old_value) / old_value * 100 if old_value else 0.0
+            worse = change > 0 if metric.endswith(LOWER_IS_BETTER) else change < 0
+            flag = '  REGRESSION' if worse and abs(change) >= 10 else ''
+            print(f"  {metric:28} {old_value:>12} -> {new_value:>12} ({change:+.1f}%){flag}")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        sys.exit(__doc__)
+    main(sys.argv[1], sys.argv[2])
@@ -0,0 +1,237 @@
+"""Reproducible load benchmark.
+
+Seeds a scratch Postgres database, swaps the exchange rate API and SMTP
+for local stand-ins, serves the app on a local port and drives the hot
+endpoints at a fixed concurrency:
+
+    python -m bench.run --database-url postgresql://localhost/shop_bench --reset
+
+Results (p50/p95/p99 latency, throughput, SQL statements per request)
+are printed and written as JSON to bench/results/, compare two runs with
+``python -m bench.compare old.json new.json``.
+
+--reset drops every table in the target database, never point it at
+real data.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+from werkzeug.serving import make_server
+
+from app import create_app, db
+from app import models  # Ensure models are registered before create_all()
+from app.auth import issue_token
+from app.metrics import SQL_STATEMENTS
+from app.settlement import process_pending_purchases
+from bench.seed import seed
+from bench.stubs import RateStubServer, SmtpSink
+
+STUB_RATES = {'USD': 1.08, 'RSD': 117.1, 'GBP': 0.85}
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(p / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(latencies, errors, elapsed, statements):
+    latencies = sorted(latencies)
+    count = len(latencies)
+    return {
+        'requests': count,
+        'errors': errors,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2) if count else None,
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2) if count else None,
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2) if count else None,
+        'throughput_rps': round(count / elapsed, 2) if elapsed else None,
+        'sql_statements_per_request': round(statements / count, 2) if count else None,
+    }
+
+
+def drive(name, make_request, total, concurrency):
+    local = threading.local()
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def one(i):
+        nonlocal errors
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        start = time.perf_counter()
+        try:
+            response = make_request(local.session, i)
+            ok = response.status_code < 500
+        except requests.RequestException:
+            ok = False
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            if not ok:
+                errors += 1
+
+    statements_before = SQL_STATEMENTS.value()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(total)))
+    elapsed = time.perf_counter() - started
+    result = summarize(latencies, errors, elapsed, SQL_STATEMENTS.value() - statements_before)
+    print(f"{name:24} {result}")
+    return result
+
+
+def issue_tokens(data):
+    # Minted directly instead of going through /login for every user
+    users = models.User.query.filter(models.User.id.in_(data['user_ids'] + [1])).all()
+    return {user.id: {'Authorization': f"Bearer {issue_token(user)}"} for user in users}
+
+
+def request_rng(seed, i):
+    # Values depend only on the seed and the request index, not on which thread runs first
+    return random.Random(seed * 1_000_003 + i)
+
+
+def scenarios(base_url, data, seed):
+    accounts = data['accounts']
+    user_ids = data['user_ids']
+    product_ids = data['product_ids']
+    currencies = data['currencies']
+    auth = data['auth']
+
+    def products(session, i):
+        return session.get(f"{base_url}/products")
+
+    def convert(session, i):
+        rng = request_rng(seed, i)
+        user_id, from_currency = rng.choice(accounts)
+        to_currency = rng.choice([c for c in currencies if c != from_currency])
+        return session.post(f"{base_url}/convert", headers=auth[user_id], json={
+            'user_id': user_id, 'from_currency': from_currency,
+            'to_currency': to_currency, 'amount': 1.0
+        })
+
+    def purchase(session, i):
+        rng = request_rng(seed, i)
+        user_id, currency = rng.choice(accounts)
+        return session.post(f"{base_url}/purchase", headers=auth[user_id], json={
+            'user_id': user_id, 'product_id': rng.choice(product_ids), 'currency': currency
+        })
+
+    def purchase_history(session, i):
+        user_id = request_rng(seed, i).choice(user_ids)
+        return session.get(f"{base_url}/get-purchase-history/{user_id}?limit=50", headers=auth[user_id])
+
+    def all_purchase_history(session, i):
+        return session.get(f"{base_url}/get-all-purchase-history?limit=50", headers=auth[1])
+
+    return {
+        'products': products,
+        'convert': convert,
+        'purchase': purchase,
+        'purchase_history': purchase_history,
+        'all_purchase_history': all_purchase_history,
+    }
+
+
+def bench_settlement(app):
+    statements_before = SQL_STATEMENTS.value()
+    started = time.perf_counter()
+    settled = process_pending_purchases(app)
+    elapsed = time.perf_counter() - started
+    result = {
+        'settled': settled,
+        'duration_s': round(elapsed, 3),
+        'throughput_per_s': round(settled / elapsed, 2) if elapsed else None,
+        'sql_statements': SQL_STATEMENTS.value() - statements_before,
+    }
+    print(f"{'settlement':24} {result}")
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', required=True, help="scratch Postgres database")
+    parser.add_argument('--reset', action='store_true', help="drop and recreate all tables before seeding")
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--products', type=int, default=200)
+    parser.add_argument('--history', type=int, default=20000, help="completed purchases")
+    parser.add_argument('--backlog', type=int, default=5000, help="pending purchases")
+    parser.add_argument('--requests', type=int, default=2000, help="requests per scenario")
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="result file, defaults to bench/results/<revision>-<time>.json")
+    args = parser.parse_args()
+
+    rate_stub = RateStubServer(STUB_RATES).start()
+    smtp_sink = SmtpSink().start()
+
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': args.database_url,
+        'EXCHANGE_RATE_PROVIDER': 'frankfurter',
+        'EXCHANGE_RATE_API_URL': rate_stub.url,
+        'MAIL_SERVER': smtp_sink.host,
+        'MAIL_PORT': smtp_sink.port,
+        'MAIL_USE_SSL': False,
+        'MAIL_USE_TLS': False,
+        'MAIL_USERNAME': None,
+        'MAIL_PASSWORD': None,
+    })
+
+    with app.app_context():
+        if args.reset:
+            db.drop_all()
+            db.create_all()
+        data = seed(users=args.users, products=args.products, history=args.history,
+                    backlog=args.backlog, seed=args.seed)
+        data['auth'] = issue_tokens(data)
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+
+    results = {}
+    try:
+        for name, make_request in scenarios(base_url, data, args.seed).items():
+            results[name] = drive(name, make_request, args.requests, args.concurrency)
+        results['settlement'] = bench_settlement(app)
+    finally:
+        server.shutdown()
+        rate_stub.stop()
+        smtp_sink.stop()
+
+    revision = git_revision()
+    report = {
+        'revision': revision,
+        'timestamp': datetime.utcnow().isoformat(),
+        'parameters': {k: v for k, v in vars(args).items() if k not in ('database_url', 'output')},
+        'exchange_rate_calls': rate_stub.calls,
+        'results': results,
+    }
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{revision}-{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Deterministic benchmark dataset.
+
+Rows are inserted with Core executemany in chunks, ids are assigned
+explicitly so the same seed always produces the same database.
+"""
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, text
+from werkzeug.security import generate_password_hash
+
+from app import db
+from app.models import Account, Card, Product, Purchase, PurchaseStatus, User
+
+CHUNK = 5000
+
+
+def seed(users=1000, products=200, currencies=('EUR', 'USD', 'RSD', 'GBP'),
+         history=20000, backlog=5000, seed=42):
+    rng = random.Random(seed)
+    password = generate_password_hash('benchmark')  # hashing is slow, do it once
+    now = datetime.utcnow()
+
+    # User 1 is the admin that settlement credits
+    user_rows = [{
+        'id': 1, 'name': 'Admin', 'surname': 'Bench', 'address': 'Bench 1', 'city': 'Bench',
+        'state': 'Bench', 'phone_number': '000', 'email': 'admin@bench.local',
+        'password': password, 'is_admin': True, 'is_verified': True
+    }]
+    for user_id in range(2, users + 1):
+        user_rows.append({
+            'id': user_id, 'name': f'User{user_id}', 'surname': 'Bench', 'address': f'Street {user_id}',
+            'city': 'Bench', 'state': 'Bench', 'phone_number': f'{user_id:09d}',
+            'email': f'user{user_id}@bench.local', 'password': password,
+            'is_admin': False, 'is_verified': rng.random() < 0.9
+        })
+    _insert(User, user_rows)
+
+    account_rows = [{'id': 1, 'user_id': 1, 'currency': 'USD', 'balance': 0.0}]
+    accounts = []
+    for user in user_rows[1:]:
+        for currency in rng.sample(currencies, rng.randint(1, len(currencies))):
+            account_rows.append({'id': len(account_rows) + 1, 'user_id': user['id'],
+                                 'currency': currency, 'balance': round(rng.uniform(1000, 100000), 2)})
+            if user['is_verified']:
+                accounts.append((user['id'], currency))
+    _insert(Account, account_rows)
+
+    card_rows = [
+        {'id': i + 1, 'user_id': user['id'], 'number': f'4{user["id"]:015d}', 'expiry': '12/30', 'cvv': '123'}
+        for i, user in enumerate(u for u in user_rows[1:] if rng.random() < 0.5)
+    ]
+    _insert(Card, card_rows)
+
+    product_rows = [{
+        'id': product_id, 'product_name': f'Product {product_id}', 'quantity': 1000000,
+        'price': round(rng.uniform(1, 500), 2), 'currency': rng.choice(currencies)
+    } for product_id in range(1, products + 1)]
+    _insert(Product, product_rows)
+
+    purchase_rows = []
+    for i in range(history + backlog):
+        user_id, currency = rng.choice(accounts)
+        created_at = now - timedelta(seconds=rng.randint(0, 365 * 24 * 3600))
+        pending = i >= history
+        purchase_rows.append({
+            'id': i + 1, 'user_id': user_id, 'product_id': rng.randint(1, products),
+            'currency': currency, 'amount': round(rng.uniform(1, 50), 2),
+            'status': PurchaseStatus.PENDING.value if pending else PurchaseStatus.COMPLETED.value,
+            'created_at': created_at,
+            'processed_at': None if pending else created_at + timedelta(seconds=30)
+        })
+    _insert(Purchase, purchase_rows)
+
+    _reset_sequences()
+    db.session.commit()
+
+    return {
+        'accounts': accounts,
+        'user_ids': sorted({user_id for user_id, _ in accounts}),
+        'product_ids': [p['id'] for p in product_rows],
+        'currencies': list(currencies),
+    }
+
+
+def _insert(model, rows):
+    for start in range(0, len(rows), CHUNK):
+        db.session.execute(insert(model.__table__), rows[start:start + CHUNK])
+
+
+def _reset_sequences():
+    # Explicit ids leave Postgres sequences behind, move them past the seeded rows
+    for table in ('user', 'account', 'card', 'product', 'purchase'):
+        db.session.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('\"{table}\"', 'id'), "
+            f"(SELECT COALESCE(MAX(id), 1) FROM \"{table}\"))"
+        ))
@@ -0,0 +1,133 @@
+"""Local stand-ins for the exchange rate API and the SMTP server."""
+import json
+import socketserver
+import threading
+import time
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class RateStubServer:
+    """Answers /latest?from=XXX like frankfurter.app, from a fixed table."""
+
+    def __init__(self, rates, base='EUR', host='127.0.0.1', port=0, latency=0.0):
+        self.rates = {currency.upper(): rate for currency, rate in rates.items()}
+        self.rates[base.upper()] = 1.0
+        self.latency = latency
+        self.calls = 0
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.calls += 1
+                if stub.latency:
+                    time.sleep(stub.latency)
+
+                query = parse_qs(urlparse(self.path).query)
+                base = query.get('from', ['EUR'])[0].upper()
+                if base not in stub.rates:
+                    self._reply(404, {'message': 'not found'})
+                    return
+                pivot = stub.rates[base]
+                self._reply(200, {
+                    'amount': 1.0,
+                    'base': base,
+                    'date': date.today().isoformat(),
+                    'rates': {c: round(r / pivot, 6) for c, r in stub.rates.items() if c != base}
+                })
+
+            def _reply(self, status, payload):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+class SmtpSink:
+    """Accepts and counts SMTP messages without delivering them."""
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.messages = 0
+        self.connections = 0
+        self._lock = threading.Lock()
+        self._server = socketserver.ThreadingTCPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def host(self):
+        return self._server.server_address[0]
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler(self):
+        sink = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                with sink._lock:
+                    sink.connections += 1
+                self._send('220 localhost SMTP sink')
+                while True:
+                    line = self.rfile.readline()
+                    if not line:
+                        return
+                    command = line.decode(errors='replace').strip().upper()
+                    if command.startswith(('EHLO', 'HELO')):
+                        self._send('250 localhost')
+                    elif command.startswith(('MAIL', 'RCPT', 'RSET', 'NOOP')):
+                        self._send('250 OK')
+                    elif command == 'DATA':
+                        self._send('354 End data with <CR><LF>.<CR><LF>')
+                        while self.rfile.readline() not in (b'.\r\n', b'.\n', b''):
+                            pass
+                        with sink._lock:
+                            sink.messages += 1
+                        self._send('250 OK')
+                    elif command == 'QUIT':
+                        self._send('221 Bye')
+                        return
+                    else:
+                        self._send('502 Command not implemented')
+
+            def _send(self, reply):
+                self.wfile.write(f'{reply}\r\n'.encode())
+
+        return Handler
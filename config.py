@@ -13,7 +13,61 @@ JWT_SECRET_KEY = 'b8f471504c115504696fa162f0d735f3233ef52c447c024f1f36b9f3136382
 SQLALCHEMY_DATABASE_URI = 'postgresql://tatjanakosic@localhost:5432/mydatabase'
 SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+# Connection pool, per process (gunicorn workers x (pool_size + max_overflow) must fit max_connections)
+SQLALCHEMY_ENGINE_OPTIONS = {
+    'pool_size': 10,
+    'max_overflow': 10,
+    'pool_timeout': 10,  # seconds to wait for a free connection
+    'pool_pre_ping': True,  # drop connections the server closed
+    'pool_recycle': 1800,  # seconds before a connection is replaced
+}
 
+# Optional read replica for read-only endpoints, e.g. 'postgresql://tatjanakosic@localhost:5432/mydatabase_replica'
+SQLALCHEMY_REPLICA_URI = None
 
+# Exchange rates - 'frankfurter' or 'stub' (EXCHANGE_RATE_STUB_RATES = {'USD': 1.08, 'RSD': 117.2, ...})
+# One table against EXCHANGE_RATE_BASE is fetched per refresh, every pair is derived from it
+EXCHANGE_RATE_PROVIDER = 'frankfurter'
+EXCHANGE_RATE_API_URL = 'https://api.frankfurter.app'
+EXCHANGE_RATE_BASE = 'EUR'
+EXCHANGE_RATE_CONNECT_TIMEOUT = 3.05
+EXCHANGE_RATE_READ_TIMEOUT = 5
+EXCHANGE_RATE_POOL_SIZE = 10
+EXCHANGE_RATE_TTL = 300  # seconds a cached rate table is considered fresh
+EXCHANGE_RATE_STALE_TTL = 3600  # seconds a stale table may still be served while refreshing
+EXCHANGE_RATE_RETRY_SECONDS = 30  # after a failed refresh, serve the last table and wait this long before retrying
+EXCHANGE_RATE_PERSIST = True  # keep snapshots in the exchange_rate table
+EXCHANGE_RATE_PREFETCH_SECONDS = 240  # leader refreshes and stores the table this often, keep below the TTL
 
+# Purchase settlement - purchases settled per transaction
+SETTLEMENT_BATCH_SIZE = 500
+SETTLEMENT_LEASE_SECONDS = 120  # a crashed worker's claim is released after this
+SETTLEMENT_IN_WEB_PROCESS = True  # set to False when running worker.py processes
+SETTLEMENT_BATCH_WINDOW = 0.2  # seconds to collect purchases after a wake-up
+SETTLEMENT_SWEEP_SECONDS = 60  # safety-net sweep when no purchase wakes the settler
+PURCHASE_RESERVATION_TTL = 900  # pending purchases older than this fail and give their stock back
 
+# Email outbox - drained in the background over one SMTP connection
+OUTBOX_POLL_SECONDS = 10
+OUTBOX_BATCH_SIZE = 100
+OUTBOX_MAX_ATTEMPTS = 8
+OUTBOX_RETRY_BASE_SECONDS = 30  # doubled after every failed attempt
+OUTBOX_RETRY_MAX_SECONDS = 3600
+
+# Product catalog snapshot and price matrix - longest either is served (covers writes from other processes)
+CATALOG_SNAPSHOT_MAX_AGE = 30
+
+# Conversion / purchase price quotes - how long a quoted rate can be executed
+QUOTE_TTL_SECONDS = 60
+
+# Background jobs - only the process holding this Postgres advisory lock runs them
+SCHEDULER_LOCK_KEY = 7262521
+LEADER_RETRY_SECONDS = 10
+
+# JSON responses - list endpoints stream the body once they return more rows than this
+JSON_STREAM_THRESHOLD = 200
+
+# Idempotency keys - how long a stored response is replayed, and how many stay in memory
+IDEMPOTENCY_KEY_TTL = 86400
+IDEMPOTENCY_CACHE_SIZE = 10000
+IDEMPOTENCY_PURGE_SECONDS = 3600
@@ -0,0 +1,22 @@
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+timeout = 30
+# Build the app once in the master, workers fork from it
+preload_app = True
+
+
+def post_fork(server, worker):
+    from app import db
+    from app.jobs import start_background_jobs_as_leader
+    from wsgi import app
+
+    # Never share pooled connections inherited from the master
+    with app.app_context():
+        db.engine.dispose()
+
+    start_background_jobs_as_leader(app)
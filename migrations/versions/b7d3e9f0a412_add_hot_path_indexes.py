@@ -0,0 +1,73 @@
+"""Add hot path indexes and unique account currency
+
+Revision ID: b7d3e9f0a412
+Revises: 4e8b2d1a6f05
+Create Date: 2026-10-18 11:47:52.610374
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d3e9f0a412'
+down_revision = '4e8b2d1a6f05'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Merge duplicate (user_id, currency) accounts into the oldest one before
+    # the unique constraint goes on, so no balance is lost
+    op.execute("""
+        UPDATE account SET balance = dup.total
+        FROM (
+            SELECT MIN(id) AS keep_id, SUM(COALESCE(balance, 0)) AS total
+            FROM account
+            GROUP BY user_id, currency
+            HAVING COUNT(*) > 1
+        ) AS dup
+        WHERE account.id = dup.keep_id
+    """)
+    op.execute("""
+        DELETE FROM account
+        USING account AS older
+        WHERE account.user_id = older.user_id
+          AND account.currency = older.currency
+          AND account.id > older.id
+    """)
+
+    with op.batch_alter_table('account', schema=None) as batch_op:
+        batch_op.create_unique_constraint('uq_account_user_id_currency', ['user_id', 'currency'])
+
+    with op.batch_alter_table('card', schema=None) as batch_op:
+        batch_op.create_index('ix_card_user_id', ['user_id'], unique=False)
+
+    with op.batch_alter_table('purchase', schema=None) as batch_op:
+        batch_op.create_index('ix_purchase_status', ['status'], unique=False)
+        batch_op.create_index('ix_purchase_user_id_created_at', ['user_id', 'created_at'], unique=False)
+        batch_op.create_index('ix_purchase_pending', ['id'], unique=False,
+                              postgresql_where=sa.text("status = 'pending'"))
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.create_index('ix_user_is_admin', ['id'], unique=False,
+                              postgresql_where=sa.text('is_admin = true'))
+        batch_op.create_index('ix_user_unverified', ['id'], unique=False,
+                              postgresql_where=sa.text('is_verified = false'))
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_index('ix_user_unverified')
+        batch_op.drop_index('ix_user_is_admin')
+
+    with op.batch_alter_table('purchase', schema=None) as batch_op:
+        batch_op.drop_index('ix_purchase_pending')
+        batch_op.drop_index('ix_purchase_user_id_created_at')
+        batch_op.drop_index('ix_purchase_status')
+
+    with op.batch_alter_table('card', schema=None) as batch_op:
+        batch_op.drop_index('ix_card_user_id')
+
+    with op.batch_alter_table('account', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_account_user_id_currency', type_='unique')
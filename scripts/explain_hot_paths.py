@@ -0,0 +1,52 @@
+"""Print EXPLAIN ANALYZE plans for the hot lookup paths.
+
+Run against a seeded database after `flask db upgrade`:
+
+    python scripts/explain_hot_paths.py
+
+Any plan that still falls back to a sequential scan is flagged.
+"""
+import os
+import sys
+
+from sqlalchemy import text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db  # noqa: E402
+
+
+HOT_PATHS = {
+    'account by user and currency':
+        "SELECT * FROM account WHERE user_id = :user_id AND currency = :currency LIMIT 1",
+    'pending purchases':
+        "SELECT * FROM purchase WHERE status = 'pending' ORDER BY id LIMIT 500",
+    'purchase history of one user':
+        "SELECT * FROM purchase WHERE user_id = :user_id ORDER BY created_at DESC LIMIT 50",
+    'cards of one user':
+        "SELECT * FROM card WHERE user_id = :user_id",
+    'unverified users':
+        "SELECT * FROM \"user\" WHERE is_verified = false",
+    'admin user':
+        "SELECT * FROM \"user\" WHERE is_admin = true LIMIT 1",
+}
+
+
+def main():
+    app = create_app()
+    with app.app_context():
+        sample = db.session.execute(text("SELECT user_id, currency FROM account LIMIT 1")).first()
+        params = {'user_id': sample.user_id, 'currency': sample.currency} if sample else {'user_id': 1, 'currency': 'USD'}
+
+        for name, sql in HOT_PATHS.items():
+            plan = [row[0] for row in db.session.execute(text(f"EXPLAIN ANALYZE {sql}"), params)]
+            flag = '  <-- sequential scan' if any('Seq Scan' in line for line in plan) else ''
+            print(f"== {name}{flag}")
+            for line in plan:
+                print(f"   {line}")
+            print()
+        db.session.rollback()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+import argparse
+import multiprocessing
+
+from app import create_app
+from app import models  # Ensure models are registered before querying
+from app.settlement import Settler
+
+
+def run_worker(sweep_interval):
+    # Every process builds its own app so it gets its own connection pool
+    app = create_app()
+    if sweep_interval:
+        app.config['SETTLEMENT_SWEEP_SECONDS'] = sweep_interval
+
+    # Woken by the NOTIFY sent from create_purchase in any web process
+    settler = Settler(app, listen=True)
+    print(f"Settlement worker {settler.worker_id} started")
+    settler.run_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Standalone purchase settlement worker")
+    parser.add_argument('--processes', type=int, default=1, help="number of parallel worker processes")
+    parser.add_argument('--sweep-interval', type=float, default=None, help="seconds between safety-net sweeps")
+    args = parser.parse_args()
+
+    if args.processes == 1:
+        run_worker(args.sweep_interval)
+    else:
+        processes = [
+            multiprocessing.Process(target=run_worker, args=(args.sweep_interval,), daemon=True)
+            for _ in range(args.processes)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
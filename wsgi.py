@@ -0,0 +1,13 @@
+"""WSGI entry point for production serving.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Background jobs are started per worker from gunicorn.conf.py (post_fork)
+and run only in the process that wins the scheduler advisory lock. Other
+WSGI servers must call app.jobs.start_background_jobs_as_leader(app) the
+same way, after forking.
+"""
+from app import create_app
+from app import models  # Ensure models are registered before serving
+
+app = create_app()